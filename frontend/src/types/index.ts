@@ -46,7 +46,7 @@ export interface TaskStatus {
 
 export interface ScrapeStatus {
   task_id: string;
-  status: "PENDING" | "PROCESSING" | "SUCCESS" | "FAILURE";
+  status: "PENDING" | "PROCESSING" | "SUCCESS" | "FAILURE" | "CANCELLED";
   pages_processed?: number;
   items_count?: number;
   error?: string;
@@ -1,18 +1,23 @@
 import asyncio
+from contextlib import nullcontext
+from typing import List, Optional
 from urllib.parse import urlparse
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
-from core.schemas import (FetchRequest, TaskResponse, TaskStatusResponse, PageData, CandidatesResponse, Candidate,
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Request
+from fastapi.responses import Response, StreamingResponse
+from core.schemas import (FetchRequest, TaskResponse, TaskStatusResponse, PageData, CandidatesResponse,
                           SelectContainerRequest, FieldsResponse, Field)
-from services.fetcher import fetch
-from services.analyzer.field_extractor import extract_fields_from_blocks
-from services.analyzer.structure import find_repeating_blocks
+from services.fetcher import fetch, load_page_html
+from services.blob_store import get_blob_store, iter_range, parse_range_header
+from services.analyzer.cache import AnalysisCache
+from services.admission import Admission, QueueFull, admission_controller, run_in_thread, user_key
+from core.config import settings
+from core.profiling import profile_key, save_profile, start_profiler
 from core.redis_client import get_redis
+from core.serialization import RawJSON, dump_model, dump_models, encode_object, load_model
 from core.database import get_db
 from models.config import ParserConfig
-from lxml import html
 import uuid
-import json
 import logging
 
 from sqlalchemy import select
@@ -23,29 +28,64 @@ router = APIRouter(prefix="/analyze", tags=["analyze"])
 logger = logging.getLogger(__name__)
 
 
-async def process_analysis(task_id: str, url: str, use_js: bool):
+async def process_analysis(task_id: str, url: str, use_js: bool, admission: Optional[Admission] = None,
+                           profile: bool = False):
     """Фоновая задача: загружает страницу, анализирует структуру, сохраняет результаты."""
     redis = await get_redis()
+    profiler = start_profiler(f"analyze {url}", profile)
     try:
-        page_data = await fetch(url, use_js)
-        # Анализируем структуру
-        candidates = find_repeating_blocks(page_data.html)
-        # Сохраняем результат страницы
-        await redis.setex(f"task:{task_id}:result", 3600, page_data.json())
-        # Сохраняем кандидатов
-        candidates_json = json.dumps([c.dict() for c in candidates])
-        await redis.setex(f"session:{task_id}:candidates", 3600, candidates_json)
-        await redis.setex(f"task:{task_id}:status", 3600, "SUCCESS")
-        logger.info(f"Task {task_id} completed, found {len(candidates)} candidate groups.")
+        async with admission or nullcontext():
+            await asyncio.wait_for(_analyze(redis, task_id, url, use_js, profiler),
+                                   timeout=settings.analysis_timeout_seconds)
+    except asyncio.TimeoutError:
+        logger.error(f"Task {task_id} timed out")
+        await redis.setex(f"task:{task_id}:status", 3600, "FAILURE")
+        await redis.setex(f"task:{task_id}:error", 3600, f"Analysis exceeded {settings.analysis_timeout_seconds}s")
     except Exception as e:
         logger.exception(f"Task {task_id} failed")
         await redis.setex(f"task:{task_id}:status", 3600, "FAILURE")
         await redis.setex(f"task:{task_id}:error", 3600, str(e))
+    finally:
+        await save_profile(redis, task_id, profiler)
+
+
+async def _analyze(redis, task_id: str, url: str, use_js: bool, profiler):
+    from lxml import html
+    from services.analyzer.structure import (block_templates, build_candidates, find_repeating_groups,
+                                             match_block_groups, structural_fingerprint)
+
+    page_data = await fetch(url, use_js, profiler)
+    with profiler.span("parse"):
+        tree = await run_in_thread(profiler.wrap(html.fromstring), page_data.html)
+        # Страницы уже известного шаблона не анализируем заново
+        fingerprint = await run_in_thread(profiler.wrap(structural_fingerprint), tree)
+    cache = AnalysisCache(redis, urlparse(url).netloc)
+    templates = await cache.get_templates(fingerprint)
+    groups = None
+    if templates is not None:
+        # Известны только шаблоны блоков: сами блоки ищем на этой странице
+        groups = await run_in_thread(profiler.wrap(match_block_groups), tree, templates)
+        if groups is not None:
+            logger.info(f"Task {task_id}: known page layout {fingerprint}, block templates taken from cache")
+    if groups is None:
+        with profiler.span("find_repeating_blocks"):
+            groups = await run_in_thread(profiler.wrap(find_repeating_groups), tree)
+        await cache.set_templates(fingerprint, block_templates(groups))
+    candidates = build_candidates(groups)
+    with profiler.span("redis_write"):
+        # Сохраняем метаданные страницы (HTML остаётся в blob store)
+        await redis.setex(f"task:{task_id}:result", 3600, dump_model(page_data))
+        await redis.setex(f"session:{task_id}:fingerprint", 3600, fingerprint)
+        # Сохраняем кандидатов
+        await redis.setex(f"session:{task_id}:candidates", 3600, dump_models(candidates))
+    await redis.setex(f"task:{task_id}:status", 3600, "SUCCESS")
+    logger.info(f"Task {task_id} completed, found {len(candidates)} candidate groups.")
 
 
 @router.post("/start", response_model=TaskResponse)
 async def start_analysis(
     req: FetchRequest,
+    request: Request,
     background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
@@ -57,10 +97,20 @@ async def start_analysis(
     if existing:
         logger.info(f"Found existing config for domain {domain}: {existing.id}")
 
+    try:
+        admission = admission_controller.admit(user_key(request, req.user_id))
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
     task_id = str(uuid.uuid4())
-    background_tasks.add_task(process_analysis, task_id, str(req.url), req.use_js)
-    redis = await get_redis()
-    await redis.setex(f"task:{task_id}:status", 3600, "PENDING")
+    try:
+        redis = await get_redis()
+        await redis.setex(f"task:{task_id}:status", 3600, "PENDING")
+        background_tasks.add_task(process_analysis, task_id, str(req.url), req.use_js, admission, req.profile)
+    except BaseException:
+        # Задача не запущена – слот освобождаем сами, иначе он занят до перезапуска процесса
+        admission.release()
+        raise
     return TaskResponse(task_id=task_id)
 
 
@@ -82,14 +132,55 @@ async def get_status(task_id: str):
     return response
 
 
+@router.get("/profile/{task_id}")
+async def get_profile(task_id: str):
+    """Профиль задачи анализа в формате speedscope (есть, если задача запускалась с profile=true)."""
+    redis = await get_redis()
+    profile_json = await redis.get(profile_key(task_id))
+    if not profile_json:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(profile_json, media_type="application/json",
+                    headers={"Content-Disposition": f'attachment; filename="profile_{task_id}.speedscope.json"'})
+
+
+@router.get("/html/{task_id}")
+async def get_page_html(task_id: str, request: Request):
+    """Отдаёт HTML проанализированной страницы с поддержкой Range."""
+    redis = await get_redis()
+    page_data_json = await redis.get(f"task:{task_id}:result")
+    if not page_data_json:
+        raise HTTPException(status_code=404, detail="Page not found")
+    ref = load_model(PageData, page_data_json).html_ref
+    compressed = await get_blob_store().get_compressed(ref.key) if ref else None
+    if compressed is None:
+        raise HTTPException(status_code=404, detail="Page HTML expired")
+
+    start, end = 0, ref.size - 1
+    status_code = 200
+    headers = {"Accept-Ranges": "bytes"}
+    range_header = request.headers.get("range")
+    if range_header:
+        byte_range = parse_range_header(range_header, ref.size)
+        if byte_range is None:
+            raise HTTPException(status_code=416, detail="Range not satisfiable",
+                                headers={"Content-Range": f"bytes */{ref.size}"})
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{ref.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(iter_range(compressed, start, end), status_code=status_code,
+                             media_type=ref.content_type, headers=headers)
+
+
 @router.get("/candidates/{session_id}", response_model=CandidatesResponse)
 async def get_candidates(session_id: str):
     redis = await get_redis()
     candidates_json = await redis.get(f"session:{session_id}:candidates")
     if not candidates_json:
         raise HTTPException(status_code=404, detail="Candidates not found")
-    candidates = [Candidate(**item) for item in json.loads(candidates_json)]
-    return CandidatesResponse(session_id=session_id, candidates=candidates)
+    # Кандидаты уже лежат в Redis в виде JSON – отдаём их без повторной валидации
+    return Response(encode_object(session_id=session_id, candidates=RawJSON(candidates_json)),
+                    media_type="application/json")
 
 
 async def extract_fields_task(session_id: str, container_selector: str):
@@ -99,39 +190,16 @@ async def extract_fields_task(session_id: str, container_selector: str):
         page_data_json = await redis.get(f"task:{session_id}:result")
         if not page_data_json:
             raise Exception("Page data not found")
-        page_data = PageData.parse_raw(page_data_json)
-
-        tree = await asyncio.to_thread(html.fromstring, page_data.html)
-        containers = await asyncio.to_thread(tree.cssselect, container_selector)
-        logger.info(f"Found {len(containers)} containers for selector '{container_selector}'")
-        if not containers:
-            raise Exception(f"Container selector '{container_selector}' not found")
-
-        blocks_html = []
-        container = containers[0]
-        for child in container.iterchildren():
-            if not isinstance(child, html.HtmlElement):
-                continue
-            if child.tag in ['script', 'style', 'noscript']:
-                continue
-            blocks_html.append(html.tostring(child, encoding='unicode'))
-            if len(blocks_html) >= 5:
-                break
-
-        logger.info(f"Extracted {len(blocks_html)} blocks from container")
-        if not blocks_html:
-            raise Exception("No blocks found inside container")
-
-        fields = extract_fields_from_blocks(blocks_html)
+        page_data = load_model(PageData, page_data_json)
+        fingerprint = await redis.get(f"session:{session_id}:fingerprint")
+        cache = AnalysisCache(redis, urlparse(page_data.url).netloc)
+        cached_fields = await cache.get_fields(fingerprint, container_selector) if fingerprint else None
+        fields = await _infer_fields(page_data, container_selector, cached_fields)
+        if cached_fields is None and fingerprint:
+            await cache.set_fields(fingerprint, container_selector, fields)
         logger.info(f"🔥 fields extracted: {len(fields)} items")
-        if isinstance(fields, list):
-            for i, f in enumerate(fields):
-                logger.info(f"  Field {i}: {f.dict()}")
-        else:
-            logger.error(f"Expected list, got {type(fields)}")
-
-        fields_json = json.dumps([f.dict() for f in fields])
-        await redis.setex(f"session:{session_id}:fields", 3600, fields_json)
+
+        await redis.setex(f"session:{session_id}:fields", 3600, dump_models(fields))
         saved = await redis.get(f"session:{session_id}:fields")
         logger.info(f"Saved in redis: {saved}")
 
@@ -143,6 +211,38 @@ async def extract_fields_task(session_id: str, container_selector: str):
         await redis.setex(f"session:{session_id}:fields_error", 3600, str(e))
 
 
+async def _infer_fields(page_data: PageData, container_selector: str,
+                        cached_fields: Optional[List[Field]] = None) -> List[Field]:
+    """Выводит поля по блокам контейнера. Для полей из кеша только подставляет примеры с этой страницы."""
+    # lxml и анализатор нужны только здесь – не загружаем их при старте API
+    from lxml import html
+    from services.analyzer.field_extractor import extract_fields_from_elements, fill_examples
+
+    page_html = await load_page_html(page_data)
+    if page_html is None:
+        raise Exception("Page HTML expired")
+
+    tree = await asyncio.to_thread(html.fromstring, page_html)
+    containers = await asyncio.to_thread(tree.cssselect, container_selector)
+    logger.info(f"Found {len(containers)} containers for selector '{container_selector}'")
+    if not containers:
+        raise Exception(f"Container selector '{container_selector}' not found")
+
+    container = containers[0]
+    blocks = [
+        child for child in container.iterchildren()
+        if isinstance(child, html.HtmlElement) and child.tag not in ['script', 'style', 'noscript']
+    ]
+    logger.info(f"Extracted {len(blocks)} blocks from container")
+    if not blocks:
+        raise Exception("No blocks found inside container")
+
+    if cached_fields is not None:
+        return await asyncio.to_thread(fill_examples, cached_fields, blocks)
+    # Статистика собирается по всем блокам контейнера, а не по первым нескольким
+    return await asyncio.to_thread(extract_fields_from_elements, blocks)
+
+
 @router.post("/select-container")
 async def select_container(req: SelectContainerRequest):
     session_id = req.session_id
@@ -175,5 +275,5 @@ async def get_fields(session_id: str):
     if not fields_json:
         raise HTTPException(status_code=404, detail="Fields not ready or not found. Try again later.")
 
-    fields = [Field(**item) for item in json.loads(fields_json)]
-    return FieldsResponse(session_id=session_id, fields=fields)
\ No newline at end of file
+    return Response(encode_object(session_id=session_id, fields=RawJSON(fields_json)),
+                    media_type="application/json")
\ No newline at end of file
@@ -1,21 +1,30 @@
 import asyncio
-import json
 import uuid
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Dict
 
+from services.exporter.cache import export_cache
 from services.exporter.exporter import Exporter
+from services.result_store import iter_result_columns, iter_results, load_result_columns, load_result_version
 from core.database import get_db
 from core.redis_client import get_redis
 from core.schemas import ScrapeStartRequest, ScrapeStatusResponse
+from core.profiling import profile_key
+from core.serialization import RawJSON, dumps, encode_object
 from models.config import ParserConfig
-from tasks.scrape_tasks import run_scrape_task
+from services.admission import QueueFull, admission_controller, user_key
+from tasks.jobs import register_scrape_job, request_cancel, scrape_jobs
 
 router = APIRouter(prefix="/scrape", tags=["scrape"])
 
 @router.post("/start")
-async def start_scrape(req: ScrapeStartRequest, db: AsyncSession = Depends(get_db)):
+async def start_scrape(req: ScrapeStartRequest, request: Request, db: AsyncSession = Depends(get_db)):
+    # Playwright и lxml подгружаются при первом запуске сбора, а не при старте API
+    from tasks.scrape_tasks import run_scrape_task
+
     task_id = str(uuid.uuid4())
     if req.config_id:
         config = await db.get(ParserConfig, req.config_id)
@@ -24,11 +33,37 @@ async def start_scrape(req: ScrapeStartRequest, db: AsyncSession = Depends(get_d
     else:
         raise HTTPException(400, "config_id required")
 
-    redis = await get_redis()
-    await redis.setex(f"scrape:{task_id}:status", 3600, "PENDING")
-    asyncio.create_task(run_scrape_task(task_id, req.config_id, str(req.start_url), req.max_pages))
+    try:
+        admission = admission_controller.admit(user_key(request, req.user_id))
+    except QueueFull as e:
+        raise HTTPException(429, str(e))
+
+    try:
+        redis = await get_redis()
+        await redis.setex(f"scrape:{task_id}:status", 3600, "PENDING")
+        job = register_scrape_job(task_id)
+        job.task = asyncio.create_task(
+            run_scrape_task(task_id, req.config_id, str(req.start_url), req.max_pages, admission, req.profile)
+        )
+    except BaseException:
+        # Задача не запущена – слот освобождаем сами, иначе он занят до перезапуска процесса
+        admission.release()
+        scrape_jobs.pop(task_id, None)
+        raise
     return {"task_id": task_id}
 
+@router.delete("/{task_id}")
+async def cancel_scrape(task_id: str):
+    """Отменяет сбор: браузер закрывается на ближайшей проверке, задача получает статус CANCELLED.
+
+    Задача может выполняться в другом процессе – она увидит флаг отмены в Redis.
+    """
+    redis = await get_redis()
+    if await redis.get(f"scrape:{task_id}:status") not in ("PENDING", "PROCESSING"):
+        raise HTTPException(404, "Task is not running")
+    await request_cancel(redis, task_id)
+    return {"task_id": task_id, "status": "CANCELLING"}
+
 @router.get("/status/{task_id}", response_model=ScrapeStatusResponse)
 async def scrape_status(task_id: str):
     redis = await get_redis()
@@ -37,52 +72,90 @@ async def scrape_status(task_id: str):
         raise HTTPException(404, "Task not found")
     pages = await redis.get(f"scrape:{task_id}:pages") or 0
     items = await redis.get(f"scrape:{task_id}:items") or 0
+    details = await redis.get(f"scrape:{task_id}:details") or 0
     error = await redis.get(f"scrape:{task_id}:error")
     return ScrapeStatusResponse(
         task_id=task_id,
         status=status,
         pages_processed=int(pages),
         items_count=int(items),
+        detail_pages_processed=int(details),
         error=error
     )
 
+@router.get("/profile/{task_id}")
+async def scrape_profile(task_id: str):
+    """Профиль задачи сбора в формате speedscope (есть, если задача запускалась с profile=true)."""
+    redis = await get_redis()
+    profile_json = await redis.get(profile_key(task_id))
+    if not profile_json:
+        raise HTTPException(404, "Profile not found")
+    return Response(profile_json, media_type="application/json",
+                    headers={"Content-Disposition": f'attachment; filename="profile_{task_id}.speedscope.json"'})
+
 @router.get("/result/{task_id}")
 async def scrape_result(task_id: str):
     redis = await get_redis()
-    data_json = await redis.get(f"scrape:{task_id}:data")
-    if not data_json:
+    if await load_result_columns(redis, task_id) is None:
         raise HTTPException(404, "Result not ready or not found")
-    data = json.loads(data_json)
-    return {"task_id": task_id, "data": data, "total_items": len(data)}
+    # Записи кодируются пачками сразу в байты, минуя валидацию и jsonable_encoder
+    chunks, total = [], 0
+    async for rows in iter_results(redis, task_id):
+        if rows:
+            chunks.append(dumps(rows)[1:-1])
+            total += len(rows)
+    data = RawJSON(b"[" + b",".join(chunks) + b"]")
+    return Response(encode_object(task_id=task_id, data=data, total_items=total), media_type="application/json")
+
+async def _write_export(redis, task_id: str, fmt: str, columns: Dict[str, str], out):
+    """Пишет экспорт в out пачками; кодирование и запись выполняются в рабочем потоке.
+
+    После каждой пачки отдаёт управление, чтобы записанное ушло клиенту.
+    """
+    writer = await asyncio.to_thread(Exporter.open_writer, fmt, out, list(columns), columns)
+    yield
+    async for batch in iter_result_columns(redis, task_id):
+        await asyncio.to_thread(writer.write_columns, batch)
+        yield
+    await asyncio.to_thread(writer.close)
 
 @router.get("/export/{task_id}")
 async def export_results(task_id: str, format: str = "json"):
     """
-    Экспортирует результаты задачи сбора в JSON или Excel.
-    Параметр format: 'json' (по умолчанию) или 'excel'.
+    Экспортирует результаты задачи сбора. Первое скачивание отдаётся потоком и параллельно
+    сохраняется на диск; повторные скачивания (до изменения результата) отдаются из файла.
+    Параметр format: 'json' (по умолчанию), 'ndjson', 'csv', 'excel' (xlsx) или 'parquet'.
     """
+    fmt = format.lower()
+    if fmt not in Exporter.FORMATS:
+        raise HTTPException(400, "Неподдерживаемый формат. Используйте 'json', 'ndjson', 'csv', 'excel' или 'parquet'.")
+    try:
+        Exporter.check_available(fmt)
+    except ImportError as e:
+        raise HTTPException(400, f"Формат '{fmt}' недоступен на сервере: {e}")
+
     redis = await get_redis()
-    data_json = await redis.get(f"scrape:{task_id}:data")
-    if not data_json:
+    columns = await load_result_columns(redis, task_id)
+    version = await load_result_version(redis, task_id)
+    if columns is None or version is None:
         raise HTTPException(404, "Данные не найдены или задача ещё не завершена")
 
-    data = json.loads(data_json)
-
-    if format.lower() == "json":
-        file_path = Exporter.to_json(data)
-        media_type = "application/json"
-        download_filename = f"results_{task_id}.json"
-    elif format.lower() == "excel":
-        file_path = Exporter.to_excel(data)
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        download_filename = f"results_{task_id}.xlsx"
-    else:
-        raise HTTPException(400, "Неподдерживаемый формат. Используйте 'json' или 'excel'.")
-
-    return FileResponse(
-        path=file_path,
-        media_type=media_type,
-        filename=download_filename
+    extension = Exporter.extension(fmt)
+    filename = f"results_{task_id}.{extension}"
+    file_path = export_cache.open_cached(task_id, extension, version)
+    if file_path is not None:
+        # Файл не вытесняется из кеша, пока ответ не отправлен
+        return FileResponse(
+            path=file_path,
+            media_type=Exporter.media_type(fmt),
+            filename=filename,
+            background=BackgroundTask(export_cache.release, file_path)
+        )
+    return StreamingResponse(
+        export_cache.stream(task_id, extension, version,
+                            lambda out: _write_export(redis, task_id, fmt, columns, out)),
+        media_type=Exporter.media_type(fmt),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
 @router.get("/needs-update/{task_id}")
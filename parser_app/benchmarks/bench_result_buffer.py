@@ -0,0 +1,73 @@
+"""Память под результаты сбора: список словарей против ColumnarResults.
+
+Запуск из каталога parser_app:
+    python -m benchmarks.bench_result_buffer [--items 100000]
+"""
+import argparse
+import gc
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from core.schemas import ConfigData, FieldSchema
+from services.scraper.result_buffer import ColumnarResults
+
+CONFIG = ConfigData(
+    container_selector="li.product",
+    fields=[
+        FieldSchema(name="title", selector="h3", type="text"),
+        FieldSchema(name="url", selector="a", type="link"),
+        FieldSchema(name="image", selector="img", type="image"),
+        FieldSchema(name="brand", selector=".brand", type="text"),
+        FieldSchema(name="price", selector=".price", type="number"),
+    ],
+)
+
+
+def make_items(start: int, stop: int) -> List[Dict[str, Any]]:
+    # Уникальные название, ссылка и картинка, повторяющийся бренд – типичный каталог
+    return [
+        {
+            "title": f"Смартфон модель {i} 128 ГБ, чёрный",
+            "url": f"https://shop.example.com/catalog/phones/item-{i}/",
+            "image": f"https://cdn.example.com/images/{i:08d}/main.jpg",
+            "brand": f"Бренд {i % 40}",
+            "price": str(10_000 + i % 5000),
+        }
+        for i in range(start, stop)
+    ]
+
+
+def measure(build: Callable[[], Any]) -> int:
+    """Байты, которые остаются занятыми построенной структурой."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def build_columnar(items: int) -> ColumnarResults:
+    results = ColumnarResults(CONFIG)
+    # Записи приходят постранично и после добавления не хранятся
+    for start in range(0, items, 1000):
+        results.extend(make_items(start, min(start + 1000, items)))
+    results.compact()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rows = measure(lambda: make_items(0, args.items))
+    columnar = measure(lambda: build_columnar(args.items))
+    print(f"{args.items} rows, list of dicts   {rows / 2 ** 20:8.1f} MB")
+    print(f"{args.items} rows, ColumnarResults {columnar / 2 ** 20:8.1f} MB   x{rows / columnar:4.1f} less")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Сравнение core.serialization со стандартным json на типичных нагрузках.
+
+Запуск из каталога parser_app:
+    python -m benchmarks.bench_serialization [--items 100000] [--repeat 5]
+"""
+import argparse
+import json
+import time
+
+from core.schemas import BlobRef, Candidate, PageData
+from core.serialization import dump_model, dump_models, dumps, load_model, load_models, loads
+from services.result_store import RESULT_BATCH_SIZE
+
+
+def _best(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _report(name: str, baseline: float, fast: float):
+    print(f"{name:<36} json {baseline * 1000:9.2f} ms   serialization {fast * 1000:9.2f} ms   x{baseline / fast:5.1f}")
+
+
+def bench_page_data(repeat: int):
+    # HTML в JSON не попадает (лежит в blob store), но модель держит его в памяти
+    page = PageData(
+        url="https://example.com/catalog?page=1",
+        final_url="https://example.com/catalog?page=1",
+        title="Каталог",
+        html="<div class='item'>Товар</div>" * 200_000,
+        html_ref=BlobRef(key="a" * 64, size=5_800_000, content_type="text/html; charset=utf-8"),
+        screenshot_ref=BlobRef(key="b" * 64, size=1_200_000, content_type="image/png"),
+    )
+    encoded = dump_model(page)
+
+    def stdlib():
+        for _ in range(1000):
+            PageData.parse_raw(page.json())
+
+    def fast():
+        for _ in range(1000):
+            load_model(PageData, dump_model(page))
+
+    assert load_model(PageData, encoded).html_ref == page.html_ref
+    _report("PageData round trip x1000", _best(stdlib, repeat), _best(fast, repeat))
+
+
+def bench_candidates(repeat: int):
+    candidates = [
+        Candidate(id=i, container_selector=f"div.list > div:nth-child({i})",
+                  example_items=[f"Пример товара {i}-{j}" for j in range(5)], count=50)
+        for i in range(2000)
+    ]
+    encoded = dump_models(candidates)
+
+    def stdlib():
+        data = json.dumps([c.dict() for c in candidates])
+        [Candidate(**item) for item in json.loads(data)]
+
+    def fast():
+        load_models(Candidate, dump_models(candidates))
+
+    assert load_models(Candidate, encoded) == candidates
+    _report("2000 candidates round trip", _best(stdlib, repeat), _best(fast, repeat))
+
+
+def bench_results(items: int, repeat: int):
+    batches = []
+    for start in range(0, items, RESULT_BATCH_SIZE):
+        stop = min(start + RESULT_BATCH_SIZE, items)
+        batches.append({
+            "title": [f"Товар №{i}" for i in range(start, stop)],
+            "price": [i * 1.5 for i in range(start, stop)],
+            "link": [f"https://example.com/item/{i}" for i in range(start, stop)],
+        })
+    encoded = [dumps(batch) for batch in batches]
+
+    _report(f"{items} results encode", _best(lambda: [json.dumps(b, ensure_ascii=False) for b in batches], repeat),
+            _best(lambda: [dumps(b) for b in batches], repeat))
+    _report(f"{items} results decode", _best(lambda: [json.loads(b) for b in encoded], repeat),
+            _best(lambda: [loads(b) for b in encoded], repeat))
+
+    rows = [dict(zip(batch, values)) for batch in batches for values in zip(*batch.values())]
+    _report(f"{items} rows /scrape/result body", _best(lambda: json.dumps({"data": rows}, ensure_ascii=False), repeat),
+            _best(lambda: dumps({"data": rows}), repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    bench_page_data(args.repeat)
+    bench_candidates(args.repeat)
+    bench_results(args.items, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,28 @@ class Settings(BaseSettings):
     log_level: str = "INFO"
     playwright_headless: bool = True
     cache_ttl_seconds: int = 3600
+    analysis_cache_ttl_seconds: int = 7 * 24 * 3600  # кеш кандидатов и полей по отпечатку структуры
+    analysis_cache_max_layouts: int = 8  # сколько шаблонов страниц одного домена держать в кеше
+    blob_backend: str = "disk"  # где хранить HTML и скриншоты: "disk" или "redis"
+    blob_dir: str = "./blobs"
+    blob_max_bytes: int = 512 * 1024 * 1024  # после превышения удаляются давно не читанные блобы
+    export_dir: str = "./exports"
+    export_max_age_seconds: int = 24 * 3600  # готовые файлы экспорта старше этого удаляются
+    export_max_bytes: int = 1024 * 1024 * 1024  # лимит суммарного размера папки экспорта
+    max_concurrent_tasks: int = 4  # одновременно выполняемых задач анализа и сбора
+    max_tasks_per_user: int = 2  # активных (выполняются или в очереди) задач на пользователя
+    max_queued_tasks: int = 20  # сверх этого новые задачи получают 429
+    scrape_job_timeout_seconds: int = 1800  # предельное время задачи сбора
+    scrape_page_timeout_ms: int = 30000  # таймаут загрузки и ожиданий на одной странице
+    scrape_cancel_poll_seconds: float = 1.0  # как часто задача проверяет флаг отмены в Redis
+    analysis_timeout_seconds: int = 120
+    scrape_extraction_mode: str = "browser"  # "browser" (page.evaluate) или "lxml" (разбор page.content())
+    scroll_wait_timeout_ms: int = 10000  # сколько ждать подгрузки новых элементов при scroll-пагинации
+    detail_max_depth: int = 3  # максимальная вложенность переходов по ссылкам на детальные страницы
+    detail_browser_max_pages: int = 5  # вкладок в браузере задачи для детальных страниц с use_js
+    profile_sample_rate: float = 0.0  # доля задач, профилируемых без явного запроса (0 – только по флагу profile)
+    profile_interval_ms: int = 10  # период сэмплирования стеков
+    profile_ttl_seconds: int = 24 * 3600
 
     class Config:
         env_file = ".env"
@@ -1,12 +1,32 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import declarative_base, sessionmaker
 from .config import settings
 
-engine = create_async_engine(settings.database_url, echo=True)
-AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# Движок создаётся при первом обращении: импорт приложения не тянет драйвер БД
+engine: AsyncEngine | None = None
+session_factory: sessionmaker | None = None
 
 Base = declarative_base()
 
+def get_engine() -> AsyncEngine:
+    global engine
+    if engine is None:
+        engine = create_async_engine(settings.database_url, echo=True)
+    return engine
+
+def AsyncSessionLocal() -> AsyncSession:
+    global session_factory
+    if session_factory is None:
+        session_factory = sessionmaker(get_engine(), class_=AsyncSession, expire_on_commit=False)
+    return session_factory()
+
+async def dispose_engine():
+    global engine, session_factory
+    if engine is not None:
+        await engine.dispose()
+        engine = None
+        session_factory = None
+
 async def get_db():
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
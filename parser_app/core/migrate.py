@@ -0,0 +1,20 @@
+"""Создание схемы БД. Запускается отдельным шагом перед стартом API: python -m core.migrate"""
+import asyncio
+import logging
+
+from core.database import Base, get_engine, dispose_engine
+import models.config  # noqa: F401 – регистрирует таблицы в Base.metadata
+
+logger = logging.getLogger(__name__)
+
+
+async def migrate():
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await dispose_engine()
+    logger.info("Database schema is up to date")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(migrate())
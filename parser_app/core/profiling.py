@@ -0,0 +1,220 @@
+"""Профилирование отдельных задач по запросу.
+
+Profiler раз в profile_interval_ms снимает стеки потоков, переданных через wrap
+(sys._current_frames), и записывает интервалы этапов (span). Результат – файл
+в формате speedscope (https://www.speedscope.app), хранится в Redis под profile:{task_id}.
+Для задач без профилирования используется NULL_PROFILER, который ничего не делает.
+"""
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.config import settings
+from core.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+# Этапы, выполняемые в асинхронном коде задачи (не в рабочих потоках)
+ASYNC_THREAD = "async"
+
+FrameKey = Tuple[str, str, int]  # (имя, файл, строка)
+
+
+def profile_key(task_id: str) -> str:
+    return f"profile:{task_id}"
+
+
+class NullProfiler:
+    """Заглушка с тем же интерфейсом: когда профилирование выключено, накладных расходов нет."""
+    enabled = False
+
+    def span(self, name: str):
+        return nullcontext()
+
+    def wrap(self, func: Callable) -> Callable:
+        return func
+
+    def stop(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    enabled = True
+
+    def __init__(self, name: str, interval_ms: Optional[int] = None):
+        self.name = name
+        self.interval = (interval_ms or settings.profile_interval_ms) / 1000
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._threads: Dict[int, str] = {}  # ident -> имя потока в отчёте
+        self._span_stacks: Dict[int, List[str]] = {}  # открытые этапы потока – префикс его стеков
+        self._samples: Dict[str, Counter] = {}  # поток -> {стек (id фреймов): число сэмплов}
+        self._spans: List[Tuple[str, str, float, float]] = []  # (поток, этап, начало, конец)
+        self._frames: Dict[FrameKey, int] = {}
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{name}", daemon=True)
+        self._sampler.start()
+
+    def _now(self) -> float:
+        return time.perf_counter() - self._started
+
+    @contextmanager
+    def span(self, name: str):
+        """Интервал этапа. В потоках, переданных через wrap, этап попадает и в стеки сэмплов."""
+        ident = threading.get_ident()
+        stack = self._span_stacks.get(ident)
+        if stack is not None:
+            stack.append(name)
+        start = self._now()
+        try:
+            yield
+        finally:
+            end = self._now()
+            if stack is not None:
+                stack.pop()
+            with self._lock:
+                self._spans.append((self._threads.get(ident, ASYNC_THREAD), name, start, end))
+
+    def wrap(self, func: Callable) -> Callable:
+        """Обёртка для asyncio.to_thread: поток сэмплируется, пока выполняется func."""
+        @wraps(func)
+        def run(*args, **kwargs):
+            ident = threading.get_ident()
+            with self._lock:
+                self._threads[ident] = f"{func.__qualname__} [{ident}]"
+                self._span_stacks[ident] = []
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._threads.pop(ident, None)
+                    self._span_stacks.pop(ident, None)
+        return run
+
+    def _frame_id(self, key: FrameKey) -> int:
+        frame_id = self._frames.get(key)
+        if frame_id is None:
+            frame_id = self._frames[key] = len(self._frames)
+        return frame_id
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, thread_name in self._threads.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        name = getattr(code, "co_qualname", code.co_name)  # co_qualname – с Python 3.11
+                        stack.append(self._frame_id((name, code.co_filename, code.co_firstlineno)))
+                        frame = frame.f_back
+                    stack.reverse()
+                    spans = [self._frame_id((f"[{name}]", "", 0)) for name in self._span_stacks[ident]]
+                    self._samples.setdefault(thread_name, Counter())[tuple(spans + stack)] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Суммарное время по этапам, мс."""
+        totals: Dict[str, float] = {}
+        for _, name, start, end in self._spans:
+            totals[name] = totals.get(name, 0.0) + (end - start) * 1000
+        return totals
+
+    def to_speedscope(self) -> Dict[str, Any]:
+        self.stop()
+        interval_ms = self.interval * 1000
+        profiles = []
+        for thread_name, counter in self._samples.items():
+            stacks = list(counter)
+            profiles.append({
+                "type": "sampled",
+                "name": f"samples: {thread_name}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(counter.values()) * interval_ms,
+                "samples": [list(stack) for stack in stacks],
+                "weights": [counter[stack] * interval_ms for stack in stacks],
+            })
+        spans_by_thread: Dict[str, List[Tuple[str, float, float]]] = {}
+        for thread_name, name, start, end in self._spans:
+            spans_by_thread.setdefault(thread_name, []).append((name, start, end))
+        end_value = self._now() * 1000
+        for thread_name, spans in spans_by_thread.items():
+            profiles.append({
+                "type": "evented",
+                "name": f"stages: {thread_name}",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": end_value,
+                "events": self._span_events(spans),
+            })
+        # Фреймы собираем последними: _span_events добавляет фреймы этапов
+        frames = [{"name": name, "file": file, "line": line} if file else {"name": name}
+                  for name, file, line in self._frames]
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": self.name,
+            "exporter": "parser_app",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def _span_events(self, spans: List[Tuple[str, float, float]]) -> List[Dict[str, Any]]:
+        """События открытия/закрытия этапов. speedscope требует строгой вложенности,
+        поэтому этап, выходящий за границу объемлющего, обрезается по ней."""
+        events = []
+        open_spans: List[Tuple[int, float]] = []  # (фрейм, конец)
+
+        def close_until(moment: float):
+            while open_spans and open_spans[-1][1] <= moment:
+                frame, end = open_spans.pop()
+                events.append({"type": "C", "frame": frame, "at": end * 1000})
+
+        for name, start, end in sorted(spans, key=lambda span: (span[1], -span[2])):
+            close_until(start)
+            if open_spans:
+                end = min(end, open_spans[-1][1])
+            frame = self._frame_id((f"[{name}]", "", 0))
+            events.append({"type": "O", "frame": frame, "at": start * 1000})
+            open_spans.append((frame, end))
+        close_until(float("inf"))
+        return events
+
+
+def start_profiler(name: str, requested: bool = False):
+    """Profiler, если профилирование запрошено или задача попала в выборку profile_sample_rate."""
+    if requested or random.random() < settings.profile_sample_rate:
+        return Profiler(name)
+    return NULL_PROFILER
+
+
+async def save_profile(redis, task_id: str, profiler) -> bool:
+    """Сохраняет профиль задачи в Redis. False – задача не профилировалась или профиль не записан."""
+    if not profiler.enabled:
+        return False
+    try:
+        data = profiler.to_speedscope()
+        await redis.setex(profile_key(task_id), settings.profile_ttl_seconds, dumps(data))
+    except Exception:
+        # Профиль – диагностика: его потеря не должна менять исход задачи
+        logger.exception(f"Failed to save profile for task {task_id}")
+        return False
+    totals = ", ".join(f"{name}={ms:.0f}ms" for name, ms in profiler.stage_totals().items())
+    logger.info(f"Profile for task {task_id} saved: {totals}")
+    return True
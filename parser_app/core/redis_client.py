@@ -2,6 +2,8 @@ from redis.asyncio import Redis
 from .config import settings
 
 redis_client: Redis | None = None
+# Отдельный клиент без decode_responses для бинарных данных (blob store)
+binary_redis_client: Redis | None = None
 
 async def get_redis() -> Redis:
     global redis_client
@@ -9,8 +11,17 @@ async def get_redis() -> Redis:
         redis_client = Redis.from_url(settings.redis_url, decode_responses=True)
     return redis_client
 
+async def get_binary_redis() -> Redis:
+    global binary_redis_client
+    if binary_redis_client is None:
+        binary_redis_client = Redis.from_url(settings.redis_url)
+    return binary_redis_client
+
 async def close_redis():
-    global redis_client
+    global redis_client, binary_redis_client
     if redis_client:
         await redis_client.close()
-        redis_client = None
\ No newline at end of file
+        redis_client = None
+    if binary_redis_client:
+        await binary_redis_client.close()
+        binary_redis_client = None
@@ -1,17 +1,28 @@
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, Field as PydanticField, model_validator
 from typing import Optional, List, Literal
 from datetime import datetime
 
 class FetchRequest(BaseModel):
     url: HttpUrl
     use_js: bool = True
+    user_id: Optional[int] = None  # для лимита задач на пользователя (не проверяется, не для безопасности)
+    profile: bool = False  # профилировать задачу; профиль – GET /analyze/profile/{task_id}
+
+# Ссылка на содержимое в blob store
+class BlobRef(BaseModel):
+    key: str  # sha256 несжатого содержимого
+    size: int  # размер без сжатия, байт
+    content_type: str
 
 class PageData(BaseModel):
     url: str
     final_url: str
-    html: str
     title: Optional[str] = None
-    screenshot: Optional[str] = None  # base64
+    html_ref: Optional[BlobRef] = None
+    screenshot_ref: Optional[BlobRef] = None
+    # Само содержимое лежит в blob store и в JSON (Redis, ответы API) не попадает
+    html: Optional[str] = PydanticField(default=None, exclude=True)
+    screenshot: Optional[str] = PydanticField(default=None, exclude=True)  # base64
 
 # Кандидаты
 class Candidate(BaseModel):
@@ -64,10 +75,35 @@ class PaginationSchema(BaseModel):
     selector: Optional[str] = None
     url_template: Optional[str] = None
 
+class DetailSchema(BaseModel):
+    link_field: str  # поле родительской записи со ссылкой на детальную страницу
+    fields: List[FieldSchema]
+    container_selector: Optional[str] = None  # область детальной страницы, по умолчанию весь документ
+    use_js: bool = False
+    max_urls: int = 1000  # сколько страниц этого уровня можно загрузить за задачу
+    concurrency: int = 5  # одновременных загрузок страниц этого уровня
+    detail: Optional["DetailSchema"] = None  # следующий уровень вложенности
+
 class ConfigData(BaseModel):
     container_selector: str
     fields: List[FieldSchema]
     pagination: Optional[PaginationSchema] = None
+    detail: Optional[DetailSchema] = None
+
+    @model_validator(mode="after")
+    def check_unique_field_names(self):
+        # Поля детальных страниц дописываются в ту же запись и не должны затирать поля
+        # верхних уровней. Одинаковые имена внутри одного уровня допустимы, как и раньше
+        ancestors = {field.name for field in self.fields}
+        detail = self.detail
+        while detail is not None:
+            names = {field.name for field in detail.fields}
+            duplicates = names & ancestors
+            if duplicates:
+                raise ValueError(f"Detail field name '{sorted(duplicates)[0]}' is already used on an upper level")
+            ancestors |= names
+            detail = detail.detail
+        return self
 
 # Для создания
 class ConfigCreate(BaseModel):
@@ -95,13 +131,16 @@ class ScrapeStartRequest(BaseModel):
     config: Optional[ConfigData] = None      # или передать конфигурацию напрямую
     start_url: HttpUrl
     max_pages: Optional[int] = None          # ограничение по страницам
+    user_id: Optional[int] = None            # для лимита задач на пользователя (не проверяется)
+    profile: bool = False                    # профилировать задачу; профиль – GET /scrape/profile/{task_id}
 
 # Статус задачи сбора
 class ScrapeStatusResponse(BaseModel):
     task_id: str
-    status: str  # "PENDING", "PROCESSING", "SUCCESS", "FAILURE"
+    status: str  # "PENDING", "PROCESSING", "SUCCESS", "FAILURE", "CANCELLED"
     pages_processed: Optional[int] = None
     items_count: Optional[int] = None
+    detail_pages_processed: Optional[int] = None
     error: Optional[str] = None
 
 # Результат сбора (список записей)
@@ -0,0 +1,82 @@
+"""Единая сериализация для Redis и ответов API.
+
+Нетипизированные данные (результаты сбора, служебные структуры) кодируются orjson,
+модели из core/schemas.py – через pydantic-core (model_dump_json / validate_json)
+без промежуточных dict. Без orjson используется стандартный json с тем же форматом.
+"""
+import json
+from functools import lru_cache
+from typing import Any, Iterable, List, Type, TypeVar, Union
+
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+Raw = Union[bytes, str]
+
+
+def _dumps_stdlib(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj: Any) -> bytes:
+    """Компактный JSON в UTF-8 (без экранирования не-ASCII символов)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson не кодирует целые за пределами 64 бит – такие данные пишем стандартным json
+            return _dumps_stdlib(obj)
+    return _dumps_stdlib(obj)
+
+
+def loads(data: Raw) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump_model(model: BaseModel) -> bytes:
+    return model.__pydantic_serializer__.to_json(model)
+
+
+def load_model(model_cls: Type[ModelT], data: Raw) -> ModelT:
+    return model_cls.model_validate_json(data)
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model_cls: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model_cls])
+
+
+def dump_models(models: Iterable[BaseModel]) -> bytes:
+    models = list(models)
+    if not models:
+        return b"[]"
+    return _list_adapter(type(models[0])).dump_json(models)
+
+
+def load_models(model_cls: Type[ModelT], data: Raw) -> List[ModelT]:
+    return _list_adapter(model_cls).validate_json(data)
+
+
+class RawJSON:
+    """Готовый JSON, который нужно вставить в ответ без повторного разбора."""
+    __slots__ = ("data",)
+
+    def __init__(self, data: Raw):
+        self.data = data.encode("utf-8") if isinstance(data, str) else data
+
+
+def encode_object(**fields: Any) -> bytes:
+    """Собирает JSON-объект, вставляя уже закодированные значения (RawJSON) как есть."""
+    parts = []
+    for name, value in fields.items():
+        encoded = value.data if isinstance(value, RawJSON) else dumps(value)
+        parts.append(dumps(name) + b":" + encoded)
+    return b"{" + b",".join(parts) + b"}"
+
@@ -8,7 +8,7 @@ from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from core.redis_client import close_redis
 from api import analyze, configs, scrape
-from core.database import engine, Base
+from core.database import dispose_engine
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 
@@ -23,13 +23,11 @@ logging.basicConfig(level=logging.INFO)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Схема БД создаётся отдельным шагом: python -m core.migrate
     yield
     # Shutdown
     await close_redis()
-    await engine.dispose()
+    await dispose_engine()
     logging.info("Redis closed, DB engine disposed")
 
 app = FastAPI(title="Parser App", lifespan=lifespan)
@@ -0,0 +1,107 @@
+import asyncio
+from collections import Counter
+from typing import Any, Callable
+
+from core.config import settings
+
+
+class QueueFull(Exception):
+    """Очередь задач заполнена или у пользователя слишком много задач."""
+    pass
+
+
+class Admission:
+    """Допуск задачи: async with ждёт свободного слота и освобождает его по завершении."""
+
+    def __init__(self, controller: "AdmissionController", user_key: str):
+        self.controller = controller
+        self.user_key = user_key
+        self._acquired = False
+        self._released = False
+
+    async def __aenter__(self):
+        try:
+            await self.controller._slots.acquire()
+        except BaseException:
+            # Задачу отменили, пока она стояла в очереди
+            self.release()
+            raise
+        self._acquired = True
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self._acquired:
+            self.controller._slots.release()
+        self.controller._pending -= 1
+        self.controller._per_user[self.user_key] -= 1
+        if self.controller._per_user[self.user_key] <= 0:
+            del self.controller._per_user[self.user_key]
+
+
+class AdmissionController:
+    """Ограничивает число одновременно выполняемых задач анализа и сбора в процессе.
+
+    Сверх max_running задачи ждут в очереди длиной до max_queued; при полной очереди
+    или превышении лимита на пользователя admit() выбрасывает QueueFull.
+    """
+
+    def __init__(self, max_running: int, max_per_user: int, max_queued: int):
+        self.max_running = max_running
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self._slots = asyncio.Semaphore(max_running)
+        self._pending = 0  # выполняются + ждут в очереди
+        self._per_user: Counter = Counter()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def admit(self, user_key: str) -> Admission:
+        if self._per_user[user_key] >= self.max_per_user:
+            raise QueueFull("Too many active tasks for this user")
+        if self._pending >= self.max_running + self.max_queued:
+            raise QueueFull("Task queue is full, try again later")
+        self._pending += 1
+        self._per_user[user_key] += 1
+        return Admission(self, user_key)
+
+
+admission_controller = AdmissionController(
+    settings.max_concurrent_tasks, settings.max_tasks_per_user, settings.max_queued_tasks
+)
+
+
+async def run_in_thread(func: Callable, *args) -> Any:
+    """asyncio.to_thread для работы внутри допуска: при отмене ждёт завершения потока.
+
+    Поток (Playwright, разбор lxml) прервать нельзя, поэтому отменённая по таймауту
+    задача держит слот, пока поток действительно не закончится – иначе браузеров
+    одновременно работает больше, чем max_concurrent_tasks.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        try:
+            await future
+        except Exception:
+            pass
+        raise
+
+
+def user_key(request, user_id=None) -> str:
+    """Ключ пользователя для лимитов: user_id из запроса, иначе адрес клиента.
+
+    user_id передаёт сам клиент и никак не проверяется, так что лимит на пользователя –
+    защита от случайной перегрузки, а не граница безопасности.
+    """
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
@@ -0,0 +1,64 @@
+import time
+from typing import List, Optional, Tuple
+
+from core.config import settings
+from core.schemas import Field
+from core.serialization import dump_models, dumps, load_models, loads
+
+
+class AnalysisCache:
+    """Результаты анализа шаблона страницы по домену и структурному отпечатку.
+
+    Хранятся только шаблоны: для кандидатов – тег и сигнатура блока, для полей – имя,
+    селектор, тип и атрибут. Блоки, их число и примеры значений каждый раз берутся
+    с анализируемой страницы.
+    На домен хранится не больше analysis_cache_max_layouts отпечатков (листинг, поиск и т.п.),
+    сверх лимита вытесняются давно не использованные.
+    """
+
+    def __init__(self, redis, domain: str, ttl: int = None, max_layouts: int = None):
+        self.redis = redis
+        self.domain = domain
+        self.ttl = ttl or settings.analysis_cache_ttl_seconds
+        self.max_layouts = max_layouts or settings.analysis_cache_max_layouts
+
+    @property
+    def _layouts_key(self) -> str:
+        return f"analysis:{self.domain}:layouts"
+
+    def _key(self, fingerprint: str, kind: str) -> str:
+        return f"analysis:{self.domain}:{fingerprint}:{kind}"
+
+    async def _touch(self, fingerprint: str):
+        await self.redis.zadd(self._layouts_key, {fingerprint: time.time()})
+        await self.redis.expire(self._layouts_key, self.ttl)
+        excess = await self.redis.zcard(self._layouts_key) - self.max_layouts
+        if excess > 0:
+            for old, _ in await self.redis.zpopmin(self._layouts_key, excess):
+                await self.redis.delete(self._key(old, "templates"), self._key(old, "fields"))
+
+    async def get_templates(self, fingerprint: str) -> Optional[List[Tuple[str, str]]]:
+        """Пары (тег блока, сигнатура блока) для шаблона страницы."""
+        cached = await self.redis.get(self._key(fingerprint, "templates"))
+        if cached is None:
+            return None
+        await self.redis.zadd(self._layouts_key, {fingerprint: time.time()}, xx=True)
+        return [tuple(template) for template in loads(cached)]
+
+    async def set_templates(self, fingerprint: str, templates: List[Tuple[str, str]]):
+        await self.redis.setex(self._key(fingerprint, "templates"), self.ttl, dumps(templates))
+        await self._touch(fingerprint)
+
+    async def get_fields(self, fingerprint: str, container_selector: str) -> Optional[List[Field]]:
+        """Поля контейнера без примеров (example=None)."""
+        cached = await self.redis.hget(self._key(fingerprint, "fields"), container_selector)
+        if cached is None:
+            return None
+        return load_models(Field, cached)
+
+    async def set_fields(self, fingerprint: str, container_selector: str, fields: List[Field]):
+        key = self._key(fingerprint, "fields")
+        # Примеры относятся к странице, с которой выведены поля, – в кеш их не кладём
+        templates = [field.model_copy(update={"example": None}) for field in fields]
+        await self.redis.hset(key, container_selector, dump_models(templates))
+        await self.redis.expire(key, self.ttl)
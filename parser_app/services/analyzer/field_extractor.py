@@ -1,85 +1,188 @@
-from lxml import html
-from typing import List, Dict, Any, Tuple
+from lxml import etree, html
+from typing import Dict, Iterable, List, Optional
 from core.schemas import Field
+import logging
 import re
 
-def is_number(s: str) -> bool:
-    """Проверяет, можно ли строку считать числом (целое или с плавающей точкой)."""
-    s = s.strip().replace(',', '.').replace(' ', '')
-    try:
-        float(s)
-        return True
-    except ValueError:
-        return False
+logger = logging.getLogger(__name__)
 
+SKIP_TAGS = {'script', 'style', 'noscript'}
+# Поле, которое встречается меньше чем в этой доле блоков, считаем шумом
+MIN_FILL_RATE = 0.3
+# Фильтры по статистике включаются только при достаточном числе блоков
+MIN_BLOCKS_FOR_FILTER = 3
 
-import logging
+_NUMBER_RE = re.compile(r'[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?')
 
-logger = logging.getLogger(__name__)
+
+def _all_numbers(values: List[str]) -> bool:
+    """Пакетная проверка: все ли значения похожи на числа."""
+    fullmatch = _NUMBER_RE.fullmatch
+    return all(fullmatch(v.replace(',', '.').replace(' ', '')) for v in values)
+
+
+class _SelectorStats:
+    """Статистика по одному селектору во всех блоках контейнера."""
+    __slots__ = ('type', 'values', 'first_seen')
+
+    def __init__(self, type_: str, first_seen: int):
+        self.type = type_
+        self.values: List[str] = []  # по одному значению на блок
+        self.first_seen = first_seen
 
 
 def extract_fields_from_blocks(blocks_html: List[str], base_url: str = None) -> List[Field]:
-    logger.debug(f"Processing {len(blocks_html)} blocks")
-    field_candidates: Dict[str, List[Tuple[str, str]]] = {}
-
-    for i, block_html in enumerate(blocks_html):
-        logger.debug(f"Processing block {i}, HTML length: {len(block_html)}")
-        tree = html.fromstring(block_html)
-        for el in tree.iter():
-            if el.tag in ['script', 'style', 'noscript']:
+    """Выводит поля по HTML-фрагментам блоков."""
+    return extract_fields_from_elements((html.fromstring(block_html) for block_html in blocks_html), base_url)
+
+
+def extract_fields_from_elements(blocks: Iterable[html.HtmlElement], base_url: str = None) -> List[Field]:
+    """Выводит поля по элементам-блокам: один проход по каждому блоку, статистика по всем блокам."""
+    stats: Dict[str, _SelectorStats] = {}
+    blocks_count = 0
+    for block in blocks:
+        _collect_block(block, stats)
+        blocks_count += 1
+
+    fields = _build_fields(stats, blocks_count)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Processed %d blocks, %d selectors, %d fields", blocks_count, len(stats), len(fields))
+    return fields
+
+
+def fill_examples(fields: List[Field], blocks: Iterable[html.HtmlElement]) -> List[Field]:
+    """Подставляет в поля (например, из кеша) примеры значений с текущей страницы.
+
+    Пример – значение из первого блока, где поле встретилось, как и при выводе полей;
+    обычно хватает первого блока.
+    """
+    stats: Dict[str, _SelectorStats] = {}
+    missing = {field.selector for field in fields}
+    for block in blocks:
+        _collect_block(block, stats)
+        missing.difference_update(stats)
+        if not missing:
+            break
+    return [
+        field.model_copy(update={"example": stats[field.selector].values[0] if field.selector in stats else None})
+        for field in fields
+    ]
+
+
+def _append_comment_tails(node, chunks: List[str]):
+    """Добавляет хвосты комментариев и инструкций, идущих подряд начиная с node.
+
+    iterwalk такие узлы не отдаёт, а их хвост – часть текста родителя
+    (например, <span>100<!-- --> ₽</span> в разметке React SSR).
+    """
+    while node is not None and not isinstance(node.tag, str):
+        if node.tail:
+            chunks.append(node.tail)
+        node = node.getnext()
+
+
+def _collect_block(block, stats: Dict[str, _SelectorStats]):
+    """Собирает значения полей одного блока за один обход дерева.
+
+    Текст элементов собирается из общего списка текстовых фрагментов по диапазонам,
+    поэтому text_content() не вызывается для каждого узла.
+    """
+    chunks: List[str] = []
+    starts: List[int] = []
+    selector_cache: Dict[tuple, str] = {}
+    seen = set()  # в каждом блоке берём первое значение селектора, как и при сборе
+
+    def record(selector: str, type_: str, value: str):
+        if selector in seen:
+            return
+        seen.add(selector)
+        entry = stats.get(selector)
+        if entry is None:
+            entry = stats[selector] = _SelectorStats(type_, len(stats))
+        entry.values.append(value)
+
+    walker = etree.iterwalk(block, events=('start', 'end'))
+    for event, el in walker:
+        tag = el.tag
+        if tag in SKIP_TAGS:
+            if event == 'start':
+                walker.skip_subtree()
+            elif el is not block:
+                if el.tail:
+                    chunks.append(el.tail)
+                _append_comment_tails(el.getnext(), chunks)
+            continue
+        if event == 'start':
+            starts.append(len(chunks))
+            if el.text:
+                chunks.append(el.text)
+            if len(el):
+                _append_comment_tails(el[0], chunks)
+            continue
+
+        start = starts.pop()
+        key = (tag, el.get('class'))
+        selector = selector_cache.get(key)
+        if selector is None:
+            selector = selector_cache[key] = _generate_relative_selector(el)
+        text = ''.join(chunks[start:]).strip()
+        if len(text) > 1:
+            record(selector, 'text', text)
+        if tag == 'a':
+            href = el.get('href')
+            if href:
+                record(selector + '[href]', 'link', href)
+        elif tag == 'img':
+            src = el.get('src')
+            if src:
+                record(selector + '[src]', 'image', src)
+        if el is not block:
+            if el.tail:
+                chunks.append(el.tail)
+            _append_comment_tails(el.getnext(), chunks)
+
+
+def _build_fields(stats: Dict[str, _SelectorStats], blocks_count: int) -> List[Field]:
+    use_filters = blocks_count >= MIN_BLOCKS_FOR_FILTER
+    scored = []
+    for selector, entry in stats.items():
+        values = entry.values
+        fill_rate = len(values) / blocks_count if blocks_count else 0
+        if use_filters:
+            if fill_rate < MIN_FILL_RATE:
                 continue
-            text = el.text_content().strip()
-            if text and len(text) > 1:
-                selector = _generate_relative_selector(el)
-                field_candidates.setdefault(selector, []).append(('text', text))
-                logger.debug(f"  Found text: {selector} = {text[:50]}...")
-            if el.tag == 'a':
-                href = el.get('href')
-                if href:
-                    selector = _generate_relative_selector(el) + '[href]'
-                    field_candidates.setdefault(selector, []).append(('link', href))
-                    logger.debug(f"  Found link: {selector} = {href}")
-            if el.tag == 'img':
-                src = el.get('src')
-                if src:
-                    selector = _generate_relative_selector(el) + '[src]'
-                    field_candidates.setdefault(selector, []).append(('image', src))
-                    logger.debug(f"  Found image: {selector} = {src}")
-
-    logger.debug(
-        f"Field candidates before filter: { {k: [(v[0], v[1][:50]) for v in values] for k, values in field_candidates.items()} }")
+            # Одинаковый во всех блоках текст – подпись или кнопка, а не данные
+            if entry.type == 'text' and len(set(values)) == 1:
+                continue
+        scored.append((fill_rate, entry, selector))
+
+    # Сначала самые заполненные поля, при равенстве – в порядке появления в блоке
+    scored.sort(key=lambda item: (-item[0], item[1].first_seen))
 
     fields = []
-    for selector, values in field_candidates.items():
-        # ослабим фильтрацию для диагностики
-        # if len(values) < 2:
-        #     continue
-        # unique_values = set(v[1] for v in values)
-        # if len(unique_values) == 1:
-        #     continue
-        type_ = values[0][0]
-        if type_ == 'text' and all(is_number(v[1]) for v in values):
+    for fill_rate, entry, selector in scored:
+        type_ = entry.type
+        if type_ == 'text' and _all_numbers(entry.values):
             type_ = 'number'
-        name = selector.replace('.', '_').replace('[', '_').replace(']', '').replace(':', '_')
-        example = values[0][1]
-        attribute = None
-        if type_ in ('link', 'image'):
-            if '[href]' in selector:
-                attribute = 'href'
-            elif '[src]' in selector:
-                attribute = 'src'
         fields.append(Field(
-            name=name,
+            name=selector.replace('.', '_').replace('[', '_').replace(']', '').replace(':', '_'),
             selector=selector,
             type=type_,
-            example=example,
-            attribute=attribute
+            example=entry.values[0],
+            attribute=_attribute_for(selector, type_),
         ))
-
-    logger.debug(f"Fields after filter (temporary unfiltered): {[f.dict() for f in fields]}")
     return fields
 
 
+def _attribute_for(selector: str, type_: str) -> Optional[str]:
+    if type_ in ('link', 'image'):
+        if selector.endswith('[href]'):
+            return 'href'
+        if selector.endswith('[src]'):
+            return 'src'
+    return None
+
+
 def _generate_relative_selector(el) -> str:
     """Генерирует CSS-селектор для элемента относительно родителя (без учёта контейнера)."""
     # Простейшая генерация по тегу и классу
@@ -88,4 +191,4 @@ def _generate_relative_selector(el) -> str:
         # Берем классы, соединяем точками
         classes = '.'.join(el.get('class').split())
         selector += f".{classes}"
-    return selector
\ No newline at end of file
+    return selector
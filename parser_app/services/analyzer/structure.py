@@ -1,9 +1,16 @@
-from lxml import html
+from lxml import etree, html
 from collections import defaultdict
 import hashlib
-from typing import List
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
 from core.schemas import Candidate
 
+SKIP_TAGS = {'script', 'style', 'noscript'}
+# Границы скелета для structural_fingerprint
+FINGERPRINT_DEPTH = 8
+FINGERPRINT_MAX_CHILDREN = 10
+# Сигнатура считается повторяющимся блоком, если встречается не меньше стольких раз
+MIN_GROUP_SIZE = 3
+
 def element_signature(el) -> str:
     """Возвращает строку тег + отсортированные классы."""
     tag = el.tag
@@ -46,8 +53,86 @@ def generate_css_selector(el) -> str:
             selector += f":nth-child({index})"
     return selector
 
-def find_repeating_blocks(html_content: str) -> List[Candidate]:
-    tree = html.fromstring(html_content)
+def structural_fingerprint(document: Union[str, html.HtmlElement]) -> str:
+    """Отпечаток структуры страницы: скелет из тегов и классов без учёта текста.
+
+    Скелет ограничен: FINGERPRINT_DEPTH уровней от body и первые FINGERPRINT_MAX_CHILDREN
+    дочерних элементов каждого узла, поэтому отпечаток не обходит весь каталог.
+    Одинаковые дочерние поддеревья учитываются один раз: число товаров на странице
+    не влияет на отпечаток, а страницы одного шаблона совпадают.
+    """
+    tree = html.fromstring(document) if isinstance(document, str) else document
+    root = tree.body if tree.body is not None else tree
+    return _skeleton_hash(root, 0)
+
+
+def _skeleton_hash(el, depth: int) -> str:
+    children = set()
+    if depth < FINGERPRINT_DEPTH:
+        taken = 0
+        for child in el.iterchildren():
+            if not isinstance(child.tag, str) or child.tag in SKIP_TAGS:
+                continue
+            children.add(_skeleton_hash(child, depth + 1))
+            taken += 1
+            if taken == FINGERPRINT_MAX_CHILDREN:
+                break
+    node = f"{element_signature(el)}({','.join(sorted(children))})"
+    return hashlib.md5(node.encode()).hexdigest()
+
+class BlockGroup(NamedTuple):
+    """Повторяющиеся блоки одной сигнатуры и селектор их контейнера."""
+    container_selector: str
+    signature: str
+    elements: List[html.HtmlElement]
+
+
+def build_candidates(groups: Sequence[BlockGroup]) -> List[Candidate]:
+    return [
+        Candidate(
+            id=i,
+            container_selector=group.container_selector,
+            example_items=[html.tostring(el, encoding='unicode')[:500] for el in group.elements[:3]],
+            count=len(group.elements)
+        )
+        for i, group in enumerate(groups, start=1)
+    ]
+
+
+def find_repeating_blocks(html_content: Union[str, html.HtmlElement]) -> List[Candidate]:
+    return build_candidates(find_repeating_groups(html_content))
+
+
+def block_templates(groups: Sequence[BlockGroup]) -> List[Tuple[str, str]]:
+    """Шаблоны для кеша: пары (тег блока, сигнатура блока)."""
+    return [(group.elements[0].tag, group.signature) for group in groups]
+
+
+def match_block_groups(document: Union[str, html.HtmlElement],
+                       templates: Sequence[Tuple[str, str]]) -> Optional[List[BlockGroup]]:
+    """Группы блоков по сохранённым шаблонам (тег, сигнатура) – то же правило, что
+    в find_repeating_groups, но сигнатуры считаются только для элементов с тегами шаблонов.
+
+    None – какой-то шаблон на странице не повторяется: вёрстка изменилась,
+    нужен полный поиск.
+    """
+    tree = html.fromstring(document) if isinstance(document, str) else document
+    body = tree.body
+    if body is None:
+        return None
+    signatures = {signature for _, signature in templates}
+    elements_by_sig = defaultdict(list)
+    for el in body.iterdescendants(*{tag for tag, _ in templates}):
+        sig = build_signature_for_element(el)
+        if sig in signatures:
+            elements_by_sig[sig].append(el)
+    if any(len(elements_by_sig[signature]) < MIN_GROUP_SIZE for signature in signatures):
+        return None
+    return _build_groups(elements_by_sig)
+
+
+def find_repeating_groups(html_content: Union[str, html.HtmlElement]) -> List[BlockGroup]:
+    tree = html.fromstring(html_content) if isinstance(html_content, str) else html_content
     body = tree.body
     if body is None:
         return []
@@ -57,24 +142,20 @@ def find_repeating_blocks(html_content: str) -> List[Candidate]:
     for el in body.iterdescendants():
         if not isinstance(el, html.HtmlElement):
             continue
-        if el.tag in ['script', 'style', 'noscript']:
+        if el.tag in SKIP_TAGS:
             continue
         sig = build_signature_for_element(el)
         candidates_by_sig[sig].append(el)
+    return _build_groups(candidates_by_sig)
+
 
+def _build_groups(elements_by_sig) -> List[BlockGroup]:
     groups = []
-    for sig, elements in candidates_by_sig.items():
-        if len(elements) >= 3:
+    for sig, elements in elements_by_sig.items():
+        if len(elements) >= MIN_GROUP_SIZE:
             # Ищем общего родителя (для простоты берём родителя первого элемента)
             container = elements[0].getparent()
             if container is None or not isinstance(container, html.HtmlElement):
                 continue
-            selector = generate_css_selector(container)
-            example_items = [html.tostring(el, encoding='unicode')[:500] for el in elements[:3]]
-            groups.append(Candidate(
-                id=len(groups) + 1,
-                container_selector=selector,
-                example_items=example_items,
-                count=len(elements)
-            ))
-    return groups
\ No newline at end of file
+            groups.append(BlockGroup(generate_css_selector(container), sig, elements))
+    return groups
@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from core.config import settings
+from core.redis_client import get_binary_redis
+
+CHUNK_SIZE = 64 * 1024
+COMPRESSION_LEVEL = 6
+
+
+def blob_key(data: bytes) -> str:
+    """Адрес блоба – хеш содержимого, поэтому одинаковые страницы хранятся один раз."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def iter_range(compressed: bytes, start: int, end: int) -> Iterator[bytes]:
+    """Потоково распаковывает блоб и отдаёт байты с start по end включительно."""
+    decompressor = zlib.decompressobj()
+    pos = 0
+    for offset in range(0, len(compressed), CHUNK_SIZE):
+        chunk = decompressor.decompress(compressed[offset:offset + CHUNK_SIZE])
+        chunk_end = pos + len(chunk)
+        if chunk_end > start:
+            yield chunk[max(start - pos, 0):end - pos + 1]
+        pos = chunk_end
+        if pos > end:
+            return
+    tail = decompressor.flush()
+    if tail and pos <= end:
+        yield tail[max(start - pos, 0):end - pos + 1]
+
+
+def parse_range_header(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Разбирает заголовок Range (один диапазон). None – диапазон невыполним."""
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first:
+            # bytes=-N – последние N байт
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, min(end, size - 1)
+
+
+class BlobStore(ABC):
+    """Контентно-адресуемое хранилище сжатых блобов (HTML, скриншоты)."""
+
+    @abstractmethod
+    async def put(self, data: bytes) -> str:
+        ...
+
+    @abstractmethod
+    async def get_compressed(self, key: str) -> Optional[bytes]:
+        ...
+
+    async def get(self, key: str) -> Optional[bytes]:
+        compressed = await self.get_compressed(key)
+        if compressed is None:
+            return None
+        return zlib.decompress(compressed)
+
+
+class DiskBlobStore(BlobStore):
+    """Блобы в файлах на локальном диске, вытеснение по времени последнего чтения."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._total: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.z"
+
+    async def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        await asyncio.to_thread(self._put_sync, key, data)
+        return key
+
+    async def get_compressed(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._read_sync, key)
+
+    def _put_sync(self, key: str, data: bytes):
+        path = self._path(key)
+        if path.exists():
+            os.utime(path)
+            return
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(compressed)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._scan())
+            else:
+                self._total += len(compressed)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _read_sync(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return data
+
+    def _scan(self):
+        for path in self.root.glob("*/*.z"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield stat.st_mtime, stat.st_size, path
+
+    def _evict(self):
+        """Удаляет самые старые блобы, пока общий размер не уложится в лимит."""
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._total = total
+
+
+class RedisBlobStore(BlobStore):
+    """Блобы в Redis; порядок обращений хранится в sorted set для вытеснения."""
+
+    INDEX_KEY = "blob:index"
+    SIZES_KEY = "blob:sizes"
+    TOTAL_KEY = "blob:total"
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+    async def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        redis = await get_binary_redis()
+        if await redis.exists(f"blob:{key}"):
+            await redis.zadd(self.INDEX_KEY, {key: time.time()}, xx=True)
+            return key
+        compressed = await asyncio.to_thread(zlib.compress, data, COMPRESSION_LEVEL)
+        # SET NX: при одновременной записи одного блоба размер учитывается только один раз
+        if not await redis.set(f"blob:{key}", compressed, nx=True):
+            await redis.zadd(self.INDEX_KEY, {key: time.time()}, xx=True)
+            return key
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self.SIZES_KEY, key, len(compressed))
+            pipe.zadd(self.INDEX_KEY, {key: time.time()})
+            pipe.incrby(self.TOTAL_KEY, len(compressed))
+            _, _, total = await pipe.execute()
+        while total > self.max_bytes:
+            oldest = await redis.zpopmin(self.INDEX_KEY)
+            if not oldest:
+                break
+            old_key = oldest[0][0].decode()
+            size = int(await redis.hget(self.SIZES_KEY, old_key) or 0)
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.delete(f"blob:{old_key}")
+                pipe.hdel(self.SIZES_KEY, old_key)
+                pipe.decrby(self.TOTAL_KEY, size)
+                _, _, total = await pipe.execute()
+        return key
+
+    async def get_compressed(self, key: str) -> Optional[bytes]:
+        redis = await get_binary_redis()
+        data = await redis.get(f"blob:{key}")
+        if data is not None:
+            await redis.zadd(self.INDEX_KEY, {key: time.time()}, xx=True)
+        return data
+
+
+blob_store: BlobStore | None = None
+
+
+def get_blob_store() -> BlobStore:
+    global blob_store
+    if blob_store is None:
+        if settings.blob_backend == "redis":
+            blob_store = RedisBlobStore(settings.blob_max_bytes)
+        else:
+            blob_store = DiskBlobStore(Path(settings.blob_dir), settings.blob_max_bytes)
+    return blob_store
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Callable, Dict, List, Optional, Set
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class _TeeOutput:
+    """Файл для писателя экспорта: байты пишутся в файл кеша и копятся для отправки клиенту.
+
+    Поток только дописывается (tell без seek), поэтому zipfile (xlsx) пишет его
+    как несжимаемый по месту поток, а pyarrow – последовательно.
+    """
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.closed = False
+        self._chunks: List[bytes] = []
+        self._written = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.file.write(data)
+        self._chunks.append(data)
+        self._written += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._written
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self):
+        pass
+
+    def take(self) -> List[bytes]:
+        """Байты, записанные с прошлого вызова."""
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+class ExportCache:
+    """Готовые файлы экспорта на диске по ключу (task_id, формат, версия результата).
+
+    Первый запрос получает экспорт потоком, и те же байты пишутся во временный файл кеша;
+    после успешной записи файл становится готовым, и повторные скачивания отдаются с диска.
+    Файл, выданный open_cached, не вытесняется по размеру и версии, пока его не освободят
+    через release() – обычно фоновой задачей ответа после отправки файла.
+    """
+
+    def __init__(self, root: Path, max_age_seconds: int, max_bytes: int):
+        self.root = Path(root)
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self._locks: Dict[str, List] = {}  # имя файла -> [lock, число ожидающих]
+        self._in_use: Dict[str, int] = {}  # имя файла -> число ответов, которые его отдают
+
+    def path_for(self, task_id: str, extension: str, version: str) -> Path:
+        return self.root / f"{task_id}_{version}.{extension}"
+
+    def open_cached(self, task_id: str, extension: str, version: str) -> Optional[Path]:
+        """Путь к готовому файлу или None. Выданный файл занят до вызова release(path)."""
+        path = self.path_for(task_id, extension, version)
+        self._acquire(path)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.release(path)
+            return None
+        return path
+
+    async def stream(self, task_id: str, extension: str, version: str,
+                     produce: Callable[[BinaryIO], AsyncIterator[Any]]) -> AsyncIterator[bytes]:
+        """Отдаёт экспорт по мере записи и одновременно сохраняет его в кеш.
+
+        produce(out) пишет экспорт в out и отдаёт управление (yield) после каждой пачки –
+        тогда накопленные байты уходят клиенту. Если ответ оборвался или produce упал,
+        временный файл удаляется. Одновременные запросы одного файла собирают его один раз:
+        остальные дожидаются сборки и читают готовый файл.
+        """
+        path = self.path_for(task_id, extension, version)
+        self._acquire(path)
+        entry = self._locks.setdefault(path.name, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if path.exists():
+                    async for chunk in self._read(path):
+                        yield chunk
+                    return
+                await asyncio.to_thread(self.root.mkdir, parents=True, exist_ok=True)
+                tmp_path = path.with_name(path.name + ".tmp")
+                file = await asyncio.to_thread(open, tmp_path, "wb")
+                try:
+                    try:
+                        out = _TeeOutput(file)
+                        async for _ in produce(out):
+                            for chunk in out.take():
+                                yield chunk
+                        for chunk in out.take():
+                            yield chunk
+                    finally:
+                        await asyncio.to_thread(file.close)
+                except BaseException:
+                    tmp_path.unlink(missing_ok=True)
+                    raise
+                os.replace(tmp_path, path)
+            # Снимок занятых файлов берём в цикле событий: в потоке словарь может меняться
+            await asyncio.to_thread(self.evict, task_id, version, set(self._in_use))
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._locks.pop(path.name, None)
+            self.release(path)
+
+    @staticmethod
+    async def _read(path: Path) -> AsyncIterator[bytes]:
+        file = await asyncio.to_thread(open, path, "rb")
+        try:
+            while True:
+                chunk = await asyncio.to_thread(file.read, READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            await asyncio.to_thread(file.close)
+
+    def _acquire(self, path: Path):
+        self._in_use[path.name] = self._in_use.get(path.name, 0) + 1
+
+    def release(self, path: Path):
+        """Освобождает файл, выданный open_cached."""
+        count = self._in_use.get(path.name, 0) - 1
+        if count > 0:
+            self._in_use[path.name] = count
+        else:
+            self._in_use.pop(path.name, None)
+
+    def evict(self, task_id: str = None, current_version: str = None, in_use: Optional[Set[str]] = None):
+        """Удаляет устаревшие версии задачи, старые файлы и самые давние сверх лимита размера."""
+        if not self.root.exists():
+            return
+        now = time.time()
+        if in_use is None:
+            in_use = set(self._in_use)
+        entries = []
+        in_use_bytes = 0
+        for path in self.root.iterdir():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            stale_version = (
+                task_id is not None and path.name.startswith(f"{task_id}_")
+                and not path.name.startswith(f"{task_id}_{current_version}.")
+                and not path.name.endswith(".tmp")
+            )
+            # Выданные файлы только что тронуты (utime или сборка), возрастом их не задевает;
+            # файл, чей release потерялся (обрыв соединения), со временем всё равно удаляется
+            if now - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                continue
+            if path.name in in_use:
+                # Файл сейчас отдаётся клиенту (или только что собран для него):
+                # в лимите учитывается, но не удаляется
+                in_use_bytes += stat.st_size
+                continue
+            if stale_version:
+                path.unlink(missing_ok=True)
+                continue
+            if not path.name.endswith(".tmp"):
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = in_use_bytes + sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.info(f"Evicted export file {path.name}")
+
+
+export_cache = ExportCache(Path(settings.export_dir), settings.export_max_age_seconds, settings.export_max_bytes)
@@ -1,28 +1,159 @@
-import json
-import pandas as pd
-from typing import List, Dict, Any
-import uuid
-from pathlib import Path
+import csv
+import importlib
+import io
+from abc import ABC, abstractmethod
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from core.serialization import dumps
+
+
+class RowWriter(ABC):
+    """Пишет записи в поток по частям: write_rows()/write_columns() для каждой пачки, затем close()."""
+
+    def __init__(self, out: BinaryIO, columns: List[str], types: Optional[Dict[str, str]] = None):
+        self.out = out
+        self.columns = columns
+        self.types = types or {}
+
+    @abstractmethod
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        ...
+
+    def write_columns(self, batch: Dict[str, List[Any]]):
+        """Пачка в колоночном виде {колонка: значения}."""
+        names = list(batch)
+        self.write_rows([dict(zip(names, values)) for values in zip(*batch.values())])
+
+    def close(self):
+        pass
+
+
+class JsonWriter(RowWriter):
+    def __init__(self, out: BinaryIO, columns: List[str], types: Optional[Dict[str, str]] = None):
+        super().__init__(out, columns, types)
+        self._first = True
+        out.write(b"[")
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        data = dumps(rows)[1:-1]
+        if not self._first:
+            self.out.write(b",")
+        self.out.write(data)
+        self._first = False
+
+    def close(self):
+        self.out.write(b"]")
+
+
+class NdjsonWriter(RowWriter):
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        self.out.write(b"".join(dumps(row) + b"\n" for row in rows))
+
+
+class CsvWriter(RowWriter):
+    def __init__(self, out: BinaryIO, columns: List[str], types: Optional[Dict[str, str]] = None):
+        super().__init__(out, columns, types)
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text)
+        self._writer.writerow(columns)
+        self._flush()
+
+    def _flush(self):
+        self.out.write(self._text.getvalue().encode("utf-8"))
+        self._text.seek(0)
+        self._text.truncate()
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        self._writer.writerows([row.get(column) for column in self.columns] for row in rows)
+        self._flush()
+
+
+class XlsxWriter(RowWriter):
+    """XLSX в write-only режиме openpyxl: строки сбрасываются во временный файл, а не держатся в памяти."""
+
+    def __init__(self, out: BinaryIO, columns: List[str], types: Optional[Dict[str, str]] = None):
+        from openpyxl import Workbook
+
+        super().__init__(out, columns, types)
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet()
+        self._sheet.append(columns)
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            self._sheet.append([row.get(column) for column in self.columns])
+
+    def close(self):
+        self._workbook.save(self.out)
+
+
+class ParquetWriter(RowWriter):
+    """Parquet: каждая пачка записей – отдельная row group."""
+
+    def __init__(self, out: BinaryIO, columns: List[str], types: Optional[Dict[str, str]] = None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        super().__init__(out, columns, types)
+        self._pa = pa
+        self._schema = pa.schema([
+            (column, pa.float64() if self.types.get(column) == "number" else pa.string())
+            for column in columns
+        ])
+        self._writer = pq.ParquetWriter(out, self._schema)
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        self.write_columns({column: [row.get(column) for row in rows] for column in self.columns})
+
+    def write_columns(self, batch: Dict[str, List[Any]]):
+        size = len(next(iter(batch.values()), []))
+        if not size:
+            return
+        data = {}
+        for column in self.columns:
+            values = batch.get(column, [None] * size)
+            if self.types.get(column) != "number":
+                values = [None if value is None else str(value) for value in values]
+            data[column] = values
+        self._writer.write_table(self._pa.Table.from_pydict(data, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
 
-# Папка для временных файлов экспорта (создаётся автоматически)
-EXPORT_DIR = Path("./exports")
-EXPORT_DIR.mkdir(exist_ok=True)
 
 class Exporter:
+    # формат -> (писатель, media type, расширение файла)
+    FORMATS = {
+        "json": (JsonWriter, "application/json", "json"),
+        "ndjson": (NdjsonWriter, "application/x-ndjson", "ndjson"),
+        "csv": (CsvWriter, "text/csv", "csv"),
+        "excel": (XlsxWriter, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+        "xlsx": (XlsxWriter, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+        "parquet": (ParquetWriter, "application/vnd.apache.parquet", "parquet"),
+    }
+    # Необязательные библиотеки форматов
+    REQUIRES = {"excel": "openpyxl", "xlsx": "openpyxl", "parquet": "pyarrow.parquet"}
+
+    @staticmethod
+    def check_available(fmt: str):
+        """ImportError, если для формата нет библиотеки. Проверяется до начала потоковой отдачи."""
+        module = Exporter.REQUIRES.get(fmt)
+        if module is not None:
+            importlib.import_module(module)
+
+    @staticmethod
+    def open_writer(fmt: str, out: BinaryIO, columns: List[str],
+                    types: Optional[Dict[str, str]] = None) -> RowWriter:
+        """Создаёт писателя для формата. ImportError – нет нужной библиотеки (pyarrow, openpyxl)."""
+        writer_cls, _, _ = Exporter.FORMATS[fmt]
+        return writer_cls(out, columns, types)
+
     @staticmethod
-    def to_json(data: List[Dict[str, Any]]) -> str:
-        """Сохраняет данные в JSON-файл и возвращает путь к файлу."""
-        filename = f"export_{uuid.uuid4().hex}.json"
-        filepath = EXPORT_DIR / filename
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        return str(filepath)
+    def media_type(fmt: str) -> str:
+        return Exporter.FORMATS[fmt][1]
 
     @staticmethod
-    def to_excel(data: List[Dict[str, Any]]) -> str:
-        """Сохраняет данные в Excel-файл и возвращает путь к файлу."""
-        filename = f"export_{uuid.uuid4().hex}.xlsx"
-        filepath = EXPORT_DIR / filename
-        df = pd.DataFrame(data)
-        df.to_excel(filepath, index=False)
-        return str(filepath)
\ No newline at end of file
+    def extension(fmt: str) -> str:
+        return Exporter.FORMATS[fmt][2]
@@ -1,22 +1,31 @@
-import hashlib
-import httpx
 import asyncio
-from playwright.sync_api import sync_playwright
-from core.schemas import PageData
+import base64
+import hashlib
+import queue
+import threading
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+from core.schemas import BlobRef, PageData
 from core.redis_client import get_redis
 from core.config import settings
+from core.profiling import NULL_PROFILER
+from core.serialization import dump_model, load_model
+from services.admission import run_in_thread
+from services.blob_store import get_blob_store
 import logging
 
 logger = logging.getLogger(__name__)
 
 def fetch_playwright_sync(url: str) -> PageData:
     """Синхронная функция для загрузки страницы через Playwright."""
+    from playwright.sync_api import sync_playwright
+
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
         context = browser.new_context(viewport={"width": 1280, "height": 800})
         page = context.new_page()
         try:
-            page.goto(url, wait_until="networkidle", timeout=30000)
+            page.goto(url, wait_until="networkidle", timeout=settings.scrape_page_timeout_ms)
             html = page.content()
             title = page.title()
             return PageData(
@@ -30,9 +39,131 @@ def fetch_playwright_sync(url: str) -> PageData:
             context.close()
             browser.close()
 
+class BrowserPagePool:
+    """Один браузер на задачу: страницы загружаются в потоке-владельце браузера.
+
+    Playwright sync API привязан к потоку, поэтому браузер, контекст и до max_pages
+    вкладок живут в одном рабочем потоке, а URL приходят через очередь. Поток забирает
+    из очереди до max_pages адресов, начинает их загрузку (goto до commit) и затем
+    дожидается каждой вкладки – страницы грузятся браузером параллельно. Браузер
+    запускается при первом запросе и закрывается в close().
+    """
+
+    def __init__(self, max_pages: int):
+        self.max_pages = max(1, max_pages)
+        self._requests: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False  # новые запросы не принимаются
+        self._thread: Optional[threading.Thread] = None
+
+    async def fetch(self, url: str) -> Tuple[str, str]:
+        """(итоговый URL, HTML) страницы."""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Browser pool is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="browser-pool", daemon=True)
+                self._thread.start()
+            self._requests.put((url, future))
+        return await asyncio.wrap_future(future)
+
+    async def close(self):
+        """Останавливает поток и закрывает браузер; ещё не начатые запросы завершаются ошибкой."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._requests.put(None)
+            await run_in_thread(thread.join)
+
+    def _next_batch(self) -> Optional[List[Tuple[str, Future]]]:
+        first = self._requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        while len(batch) < self.max_pages:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._requests.put(None)  # остановка после текущей пачки
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        from playwright.sync_api import sync_playwright
+
+        batch: List[Tuple[str, Future]] = []
+        error: Exception = RuntimeError("Browser pool is closed")
+        try:
+            with sync_playwright() as p:
+                browser = p.chromium.launch(headless=True)
+                try:
+                    context = browser.new_context(viewport={"width": 1280, "height": 800})
+                    pages = []
+                    while True:
+                        batch = self._next_batch()
+                        if batch is None:
+                            break
+                        while len(pages) < len(batch):
+                            pages.append(context.new_page())
+                        self._load_batch(list(zip(pages, batch)))
+                finally:
+                    browser.close()
+        except Exception as e:
+            logger.exception("Browser pool failed")
+            error = e
+        finally:
+            with self._lock:
+                self._closed = True
+            for _, future in batch or []:
+                self._fail(future, error)
+            while True:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is not None:
+                    self._fail(request[1], error)
+
+    def _load_batch(self, batch):
+        timeout = settings.scrape_page_timeout_ms
+        started = []
+        for page, (url, future) in batch:
+            # Запрос отменён, пока ждал в очереди
+            if not future.set_running_or_notify_cancel():
+                continue
+            if self._closed:
+                future.set_exception(RuntimeError("Browser pool is closed"))
+                continue
+            try:
+                page.goto(url, wait_until="commit", timeout=timeout)
+                started.append((page, future))
+            except Exception as e:
+                future.set_exception(e)
+        for page, future in started:
+            try:
+                page.wait_for_load_state("networkidle", timeout=timeout)
+                future.set_result((page.url, page.content()))
+            except Exception as e:
+                future.set_exception(e)
+
+    @staticmethod
+    def _fail(future: Future, error: Exception):
+        if future.done():
+            return
+        if future.running() or future.set_running_or_notify_cancel():
+            future.set_exception(error)
+
+
 async def fetch_httpx(url: str) -> PageData:
+    import httpx
+
     async with httpx.AsyncClient(follow_redirects=True) as client:
-        resp = await client.get(url, timeout=30)
+        resp = await client.get(url, timeout=settings.scrape_page_timeout_ms / 1000)
         resp.raise_for_status()
         return PageData(
             url=url,
@@ -41,24 +172,52 @@ async def fetch_httpx(url: str) -> PageData:
             title=None
         )
 
-async def fetch(url: str, use_js: bool = True) -> PageData:
+async def store_page_blobs(page_data: PageData) -> PageData:
+    """Кладёт HTML и скриншот в blob store и проставляет ссылки на них."""
+    store = get_blob_store()
+    if page_data.html is not None and page_data.html_ref is None:
+        data = page_data.html.encode("utf-8")
+        page_data.html_ref = BlobRef(key=await store.put(data), size=len(data),
+                                     content_type="text/html; charset=utf-8")
+    if page_data.screenshot and page_data.screenshot_ref is None:
+        data = base64.b64decode(page_data.screenshot)
+        page_data.screenshot_ref = BlobRef(key=await store.put(data), size=len(data), content_type="image/png")
+    return page_data
+
+async def load_page_html(page_data: PageData) -> Optional[str]:
+    """Подгружает HTML из blob store. None – блоб уже вытеснен."""
+    if page_data.html is None and page_data.html_ref is not None:
+        data = await get_blob_store().get(page_data.html_ref.key)
+        if data is None:
+            return None
+        page_data.html = data.decode("utf-8")
+    return page_data.html
+
+async def fetch(url: str, use_js: bool = True, profiler=NULL_PROFILER) -> PageData:
     redis = await get_redis()
     cache_key = f"page:{hashlib.md5(url.encode()).hexdigest()}"
     cached = await redis.get(cache_key)
     if cached:
-        logger.info(f"Cache hit for {url}")
-        return PageData.parse_raw(cached)
+        page_data = load_model(PageData, cached)
+        if await load_page_html(page_data) is not None:
+            logger.info(f"Cache hit for {url}")
+            return page_data
+        logger.info(f"Cached blob for {url} was evicted, refetching")
 
     logger.info(f"Fetching {url} with use_js={use_js}")
     try:
-        if use_js:
-            # Запускаем синхронную функцию в отдельном потоке
-            page_data = await asyncio.to_thread(fetch_playwright_sync, url)
-        else:
-            page_data = await fetch_httpx(url)
+        with profiler.span("fetch"):
+            if use_js:
+                # Запускаем синхронную функцию в отдельном потоке
+                page_data = await run_in_thread(profiler.wrap(fetch_playwright_sync), url)
+            else:
+                page_data = await fetch_httpx(url)
     except Exception as e:
         logger.error(f"Error fetching {url}: {e}")
         raise
 
-    await redis.setex(cache_key, settings.cache_ttl_seconds, page_data.json())
+    # В Redis кладём только метаданные, HTML хранится в blob store
+    with profiler.span("redis_write"):
+        await store_page_blobs(page_data)
+        await redis.setex(cache_key, settings.cache_ttl_seconds, dump_model(page_data))
     return page_data
\ No newline at end of file
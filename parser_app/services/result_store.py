@@ -0,0 +1,64 @@
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from core.serialization import dumps, loads
+from services.scraper.result_buffer import ColumnarResults
+
+# Результаты хранятся в Redis списком пачек в колоночном виде ({колонка: значения}),
+# чтобы читать и экспортировать их частями, не повторяя имена полей в каждой записи
+RESULT_BATCH_SIZE = 1000
+
+
+def _rows_key(task_id: str) -> str:
+    return f"scrape:{task_id}:rows"
+
+
+def _columns_key(task_id: str) -> str:
+    return f"scrape:{task_id}:columns"
+
+
+def _version_key(task_id: str) -> str:
+    return f"scrape:{task_id}:version"
+
+
+async def save_results(redis, task_id: str, results: ColumnarResults, ttl: int = 3600):
+    key = _rows_key(task_id)
+    await redis.delete(key)
+    for batch in results.iter_batches(RESULT_BATCH_SIZE):
+        await redis.rpush(key, dumps(batch))
+    await redis.expire(key, ttl)
+    # Версия меняется при каждой записи результата – по ней кешируются файлы экспорта
+    await redis.setex(_version_key(task_id), ttl, uuid.uuid4().hex)
+    # Колонки с типами пишем последними: по ним определяется, что результат готов
+    await redis.setex(_columns_key(task_id), ttl, dumps(results.column_types()))
+
+
+async def load_result_columns(redis, task_id: str) -> Optional[Dict[str, str]]:
+    """Колонки результата и их типы ("text" или "number") в порядке полей."""
+    columns_json = await redis.get(_columns_key(task_id))
+    if columns_json is None:
+        return None
+    return loads(columns_json)
+
+
+async def load_result_version(redis, task_id: str) -> Optional[str]:
+    return await redis.get(_version_key(task_id))
+
+
+async def iter_result_columns(redis, task_id: str) -> AsyncIterator[Dict[str, List[Any]]]:
+    """Отдаёт результаты пачками {колонка: значения}, не загружая всё в память."""
+    key = _rows_key(task_id)
+    position = 0
+    while True:
+        chunk = await redis.lindex(key, position)
+        if chunk is None:
+            break
+        yield loads(chunk)
+        position += 1
+
+
+async def iter_results(redis, task_id: str) -> AsyncIterator[List[Dict[str, Any]]]:
+    """То же, что iter_result_columns, но пачками записей."""
+    async for batch in iter_result_columns(redis, task_id):
+        names = list(batch)
+        yield [dict(zip(names, values)) for values in zip(*batch.values())]
@@ -0,0 +1,50 @@
+from typing import Any, Dict, List, Tuple
+from core.schemas import ConfigData
+
+# Извлечение полей прямо в браузере: один вызов page.evaluate на страницу
+# вместо передачи всего DOM через page.content() и разбора в lxml.
+# Семантика повторяет lxml-путь: первый подходящий элемент (включая сам контейнер),
+# текст через textContent, ссылки и картинки приводятся к абсолютным URL.
+_EXTRACT_JS = """
+({container, fields, start}) => {
+    const resolve = (value) => {
+        if (!value || /^https?:\\/\\//.test(value)) return value;
+        try { return new URL(value, location.href).href; } catch (e) { return value; }
+    };
+    const containers = document.querySelectorAll(container);
+    const rows = [];
+    for (let i = start; i < containers.length; i++) {
+        const node = containers[i];
+        const row = {};
+        for (const field of fields) {
+            const el = node.matches(field.selector) ? node : node.querySelector(field.selector);
+            let value = null;
+            if (el) {
+                if (field.type === 'text' || field.type === 'number') value = el.textContent.trim();
+                else if (field.type === 'link') value = resolve(el.getAttribute('href'));
+                else if (field.type === 'image') value = resolve(el.getAttribute('src'));
+            }
+            row[field.name] = value;
+        }
+        rows.push(row);
+    }
+    return {total: containers.length, rows: rows};
+}
+"""
+
+
+def compile_config(config: ConfigData) -> Dict[str, Any]:
+    """Готовит компактный аргумент для JS-экстрактора из конфигурации."""
+    return {
+        "container": config.container_selector,
+        "fields": [
+            {"name": field.name, "selector": field.selector, "type": field.type}
+            for field in config.fields
+        ],
+    }
+
+
+def extract_in_browser(page, compiled: Dict[str, Any], start: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+    """Возвращает общее число контейнеров на странице и строки, начиная с start."""
+    result = page.evaluate(_EXTRACT_JS, {**compiled, "start": start})
+    return result["total"], result["rows"]
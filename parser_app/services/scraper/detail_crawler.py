@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from lxml import html
+
+from core.config import settings
+from core.schemas import DetailSchema
+from services.admission import run_in_thread
+from services.fetcher import BrowserPagePool
+from .exceptions import ScrapeCancelled
+from .frontier import UrlFrontier, normalize_url
+from .result_buffer import ColumnarResults
+from .sync_scraper import extract_item
+
+logger = logging.getLogger(__name__)
+
+
+class DetailCrawler:
+    """Переходит по ссылкам из собранных записей и дополняет их полями детальных страниц.
+
+    Уровни с use_js загружаются через один браузер на задачу (BrowserPagePool): обход
+    идёт внутри допуска задачи, поэтому задача не держит больше одного браузера.
+    """
+
+    def __init__(self, detail: DetailSchema, max_depth: Optional[int] = None,
+                 cancel_event: Optional[threading.Event] = None):
+        self.detail = detail
+        self.cancel_event = cancel_event
+        self.max_depth = max_depth or settings.detail_max_depth
+        self.pages_processed = 0
+        self.errors = 0
+        self._browser: Optional[BrowserPagePool] = None
+
+    async def crawl(self, results: ColumnarResults) -> int:
+        """Обходит детальные страницы по уровням вложенности. Записи дополняются на месте."""
+        # Пул общий для всех уровней, параллельность каждого уровня ограничивает его семафор
+        max_connections = max(level.concurrency for level in self._levels())
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        timeout = settings.scrape_page_timeout_ms / 1000
+        js_levels = [level for level in self._levels() if level.use_js]
+        if js_levels:
+            self._browser = BrowserPagePool(min(max(level.concurrency for level in js_levels),
+                                                settings.detail_browser_max_pages))
+        try:
+            await self._crawl_levels(results, limits, timeout)
+        finally:
+            if self._browser is not None:
+                await self._browser.close()
+        logger.info(f"Detail crawl finished: {self.pages_processed} pages, {self.errors} errors")
+        return self.pages_processed
+
+    async def _crawl_levels(self, results: ColumnarResults, limits: httpx.Limits, timeout: float):
+        detail = self.detail
+        level_items = range(len(results))
+        depth = 1
+        async with httpx.AsyncClient(follow_redirects=True, limits=limits, timeout=timeout) as client:
+            while detail is not None and level_items and depth <= self.max_depth:
+                # Лимит max_urls у каждого уровня свой
+                frontier = UrlFrontier(max_urls=detail.max_urls)
+                waiters: Dict[str, List[int]] = defaultdict(list)
+                merged = []
+                for item in level_items:
+                    url = results.get(item, detail.link_field)
+                    if not url:
+                        continue
+                    url = normalize_url(url)
+                    # Записи с одной ссылкой ждут одну загрузку страницы
+                    if url in waiters or frontier.add(url):
+                        waiters[url].append(item)
+
+                semaphore = asyncio.Semaphore(detail.concurrency)
+                fetched = await asyncio.gather(*(
+                    self._process(client, semaphore, detail, url) for url in waiters
+                ))
+                for url, values in fetched:
+                    if values is None:
+                        continue
+                    for item in waiters[url]:
+                        results.update(item, values)
+                        merged.append(item)
+
+                if self._cancelled():
+                    raise ScrapeCancelled(f"Detail crawl cancelled after {self.pages_processed} pages")
+                level_items = merged
+                detail = detail.detail
+                depth += 1
+
+    async def _process(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore,
+                       detail: DetailSchema, url: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        async with semaphore:
+            if self._cancelled():
+                return url, None
+            try:
+                final_url, content = await self._fetch(client, detail, url)
+                values = await run_in_thread(self._extract, detail, content, final_url)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Detail page {url} failed: {e}")
+                return url, None
+        self.pages_processed += 1
+        return url, values
+
+    def _levels(self) -> List[DetailSchema]:
+        levels = []
+        detail = self.detail
+        while detail is not None:
+            levels.append(detail)
+            detail = detail.detail
+        return levels
+
+    def _cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    async def _fetch(self, client: httpx.AsyncClient, detail: DetailSchema, url: str) -> Tuple[str, str]:
+        if detail.use_js:
+            return await self._browser.fetch(url)
+        resp = await client.get(url)
+        resp.raise_for_status()
+        return str(resp.url), resp.text
+
+    @staticmethod
+    def _extract(detail: DetailSchema, content: str, base_url: str) -> Dict[str, Any]:
+        tree = html.fromstring(content)
+        scope = tree
+        if detail.container_selector:
+            matches = tree.cssselect(detail.container_selector)
+            if not matches:
+                raise ValueError(f"Container selector '{detail.container_selector}' not found")
+            scope = matches[0]
+        return extract_item(scope, detail.fields, base_url)
@@ -8,4 +8,12 @@ class NoContainerFound(ScraperError):
 
 class NoFieldsExtracted(ScraperError):
     """Не удалось извлечь ни одного поля из блоков."""
-    pass
\ No newline at end of file
+    pass
+
+class ScrapeCancelled(ScraperError):
+    """Сбор отменён пользователем."""
+    pass
+
+class ScrapeTimeout(ScraperError):
+    """Превышено предельное время задачи сбора."""
+    pass
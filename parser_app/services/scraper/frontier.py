@@ -0,0 +1,34 @@
+from typing import Optional
+from urllib.parse import urldefrag
+
+
+def normalize_url(url: str) -> str:
+    """Приводит URL к виду для дедупликации: без фрагмента и пробелов по краям."""
+    return urldefrag(url.strip())[0]
+
+
+class UrlFrontier:
+    """Очередь URL одной задачи: дедупликация и ограничения по числу и глубине."""
+
+    def __init__(self, max_urls: Optional[int] = None, max_depth: Optional[int] = None):
+        self.max_urls = max_urls
+        self.max_depth = max_depth
+        self._seen = set()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def __contains__(self, url: str) -> bool:
+        return normalize_url(url) in self._seen
+
+    def add(self, url: str, depth: int = 1) -> bool:
+        """Регистрирует URL. False – уже встречался или превышен лимит."""
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        if self.max_urls is not None and len(self._seen) >= self.max_urls:
+            return False
+        url = normalize_url(url)
+        if url in self._seen:
+            return False
+        self._seen.add(url)
+        return True
@@ -0,0 +1,286 @@
+import math
+import re
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+
+from core.schemas import ConfigData
+
+_NUMBER_RE = re.compile(r'[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?')
+# Целые до 2**53 float64 хранит точно
+_MAX_EXACT_INT = 2 ** 53
+# Строки из 16 и более значащих цифр – артикулы и штрихкоды, а не величины
+_MAX_SIGNIFICANT_DIGITS = 15
+# Текстовая колонка перестаёт использовать словарь, когда разных значений больше этой доли
+# записей (проверяется начиная с _DICTIONARY_MIN_ROWS записей)
+_DICTIONARY_MAX_RATIO = 0.5
+_DICTIONARY_MIN_ROWS = 1000
+
+
+def _decode_number(number: float) -> Any:
+    if math.isnan(number):
+        return None
+    return int(number) if number.is_integer() and abs(number) <= _MAX_EXACT_INT else number
+
+
+def parse_number(value: Any) -> Optional[float]:
+    """Приводит значение поля number к float без потерь.
+
+    ValueError – значение не число или не восстанавливается из float в исходном
+    виде ("007", "1 299", "12,5", длинные артикулы) – такое значение остаётся строкой.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Not a number: {value!r}")
+    if isinstance(value, int):
+        if abs(value) > _MAX_EXACT_INT:
+            raise ValueError(f"Integer is not exact as float: {value!r}")
+        return float(value)
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError(f"Not a finite number: {value!r}")
+        return value
+    s = str(value).strip()
+    if not s:
+        return None
+    if not _NUMBER_RE.fullmatch(s):
+        raise ValueError(f"Not a number: {value!r}")
+    if len(s.lstrip('+-').replace('.', '').lstrip('0')) > _MAX_SIGNIFICANT_DIGITS:
+        raise ValueError(f"Too many significant digits: {value!r}")
+    number = float(s)
+    if not math.isfinite(number) or str(_decode_number(number)) != s:
+        raise ValueError(f"Number does not round-trip: {value!r}")
+    return number
+
+
+class _TextColumn:
+    """Строковая колонка со словарным кодированием: повторяющиеся значения хранятся один раз."""
+    type = "text"
+
+    def __init__(self, length: int = 0):
+        self.codes = array('i', [-1]) * length  # -1 – пустое значение
+        self.values: List[Any] = []
+        self.index: Optional[Dict[Any, int]] = {}  # нужен только для записи, после сбора освобождается
+
+    def _encode(self, value: Any) -> int:
+        if value is None:
+            return -1
+        if self.index is None:
+            self.index = {value: code for code, value in enumerate(self.values)}
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def append(self, value: Any):
+        self.codes.append(self._encode(value))
+
+    def set(self, position: int, value: Any):
+        self.codes[position] = self._encode(value)
+
+    def get(self, position: int) -> Any:
+        code = self.codes[position]
+        return None if code < 0 else self.values[code]
+
+    def slice(self, start: int, stop: int) -> List[Any]:
+        values = self.values
+        return [None if code < 0 else values[code] for code in self.codes[start:stop]]
+
+    def too_diverse(self) -> bool:
+        """Словарь не окупается: почти все значения разные (названия, ссылки)."""
+        rows = len(self.codes)
+        return rows >= _DICTIONARY_MIN_ROWS and len(self.values) > rows * _DICTIONARY_MAX_RATIO
+
+    def to_plain(self) -> "_PlainTextColumn":
+        column = _PlainTextColumn()
+        for position in range(len(self.codes)):
+            column.append(self.get(position))
+        return column
+
+    def compact(self):
+        self.index = None
+
+
+class _PlainTextColumn:
+    """Строковая колонка без словаря: значения подряд в UTF-8 в одном bytearray.
+
+    Для колонок с уникальными значениями вместо объекта str на запись хранятся
+    только байты строки и смещение с длиной.
+    """
+    type = "text"
+
+    def __init__(self, length: int = 0):
+        self.data = bytearray()
+        self.starts = array('q', [0]) * length
+        self.lengths = array('i', [-1]) * length  # -1 – пустое значение
+        self.garbage = 0  # байты значений, перезаписанных через set
+
+    def _put(self, value: Any):
+        if value is None:
+            return 0, -1
+        encoded = str(value).encode('utf-8')
+        start = len(self.data)
+        self.data += encoded
+        return start, len(encoded)
+
+    def append(self, value: Any):
+        start, length = self._put(value)
+        self.starts.append(start)
+        self.lengths.append(length)
+
+    def set(self, position: int, value: Any):
+        self.garbage += max(self.lengths[position], 0)
+        self.starts[position], self.lengths[position] = self._put(value)
+
+    def get(self, position: int) -> Any:
+        length = self.lengths[position]
+        if length < 0:
+            return None
+        start = self.starts[position]
+        return self.data[start:start + length].decode('utf-8')
+
+    def slice(self, start: int, stop: int) -> List[Any]:
+        return [self.get(position) for position in range(start, stop)]
+
+    def too_diverse(self) -> bool:
+        return False
+
+    def compact(self):
+        if not self.garbage:
+            return
+        # Перепаковываем без байтов перезаписанных значений
+        values = self.slice(0, len(self.lengths))
+        self.__init__()
+        for value in values:
+            self.append(value)
+
+
+class _NumberColumn:
+    """Числовая колонка в array('d'); NaN – пустое значение."""
+    type = "number"
+
+    def __init__(self, length: int = 0):
+        self.data = array('d', [math.nan]) * length
+
+    _decode = staticmethod(_decode_number)
+
+    def append(self, value: Any):
+        number = parse_number(value)
+        self.data.append(math.nan if number is None else number)
+
+    def set(self, position: int, value: Any):
+        number = parse_number(value)
+        self.data[position] = math.nan if number is None else number
+
+    def get(self, position: int) -> Any:
+        return self._decode(self.data[position])
+
+    def slice(self, start: int, stop: int) -> List[Any]:
+        return [self._decode(number) for number in self.data[start:stop]]
+
+    def too_diverse(self) -> bool:
+        return False
+
+    def compact(self):
+        pass
+
+    def to_text(self) -> _TextColumn:
+        column = _TextColumn()
+        for number in self.data:
+            value = self._decode(number)
+            column.append(None if value is None else str(value))
+        return column
+
+
+class ColumnarResults:
+    """Результаты сбора по колонкам: по массиву на поле вместо словаря на каждую запись.
+
+    Колонки задаются полями конфигурации (включая детальные страницы);
+    неизвестные ключи добавляются как текстовые колонки на лету. Текстовая колонка
+    начинает со словарного кодирования и переходит на хранение строк подряд,
+    если значения почти не повторяются.
+    """
+
+    def __init__(self, config: ConfigData):
+        self._columns: Dict[str, Any] = {}
+        self._length = 0
+        fields = list(config.fields)
+        detail = config.detail
+        while detail is not None:
+            fields.extend(detail.fields)
+            detail = detail.detail
+        for field in fields:
+            if field.name not in self._columns:
+                self._columns[field.name] = _NumberColumn() if field.type == 'number' else _TextColumn()
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+
+    def column_types(self) -> Dict[str, str]:
+        return {name: column.type for name, column in self._columns.items()}
+
+    def _column(self, name: str):
+        column = self._columns.get(name)
+        if column is None:
+            column = self._columns[name] = _TextColumn(self._length)
+        return column
+
+    def _store(self, name: str, value: Any, position: Optional[int] = None):
+        column = self._column(name)
+        try:
+            if position is None:
+                column.append(value)
+            else:
+                column.set(position, value)
+        except ValueError:
+            # Значение поля number не разбирается – колонка становится текстовой
+            column = self._columns[name] = column.to_text()
+            value = None if value is None else str(value)
+            if position is None:
+                column.append(value)
+            else:
+                column.set(position, value)
+        if column.too_diverse():
+            self._columns[name] = column.to_plain()
+
+    def append(self, item: Dict[str, Any]):
+        for name in item:
+            self._column(name)
+        for name in self._columns:
+            self._store(name, item.get(name))
+        self._length += 1
+
+    def extend(self, items: List[Dict[str, Any]]):
+        for item in items:
+            self.append(item)
+
+    def compact(self):
+        """Освобождает служебные структуры записи; вызывается, когда сбор закончен."""
+        for column in self._columns.values():
+            column.compact()
+
+    def get(self, position: int, name: str) -> Any:
+        column = self._columns.get(name)
+        return None if column is None else column.get(position)
+
+    def update(self, position: int, values: Dict[str, Any]):
+        for name, value in values.items():
+            self._store(name, value, position)
+
+    def row(self, position: int) -> Dict[str, Any]:
+        return {name: column.get(position) for name, column in self._columns.items()}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for position in range(self._length):
+            yield self.row(position)
+
+    def iter_batches(self, batch_size: int) -> Iterator[Dict[str, List[Any]]]:
+        """Отдаёт результаты пачками в виде {колонка: значения}."""
+        for start in range(0, self._length, batch_size):
+            stop = min(start + batch_size, self._length)
+            yield {name: column.slice(start, stop) for name, column in self._columns.items()}
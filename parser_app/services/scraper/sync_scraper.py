@@ -1,75 +1,163 @@
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import sync_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
 from lxml import html
+import logging
+import threading
+import time
 from urllib.parse import urljoin
 from typing import List, Dict, Any, Optional
+from core.config import settings
+from core.profiling import NULL_PROFILER
 from core.schemas import ConfigData
-from .exceptions import NoContainerFound, NoFieldsExtracted
+from .browser_extractor import compile_config, extract_in_browser
+from .result_buffer import ColumnarResults
+from .exceptions import NoContainerFound, NoFieldsExtracted, ScrapeCancelled, ScrapeTimeout
+
+logger = logging.getLogger(__name__)
+
+# JS-выражения для scroll-пагинации: считаем элементы контейнера в браузере,
+# чтобы не гонять весь DOM через page.content() на каждой итерации.
+_WAIT_NEW_ITEMS_JS = "([selector, count]) => document.querySelectorAll(selector).length > count"
+_NEW_ITEMS_HTML_JS = (
+    "([selector, start]) => Array.from(document.querySelectorAll(selector))"
+    ".slice(start).map(el => el.outerHTML)"
+)
+
+
+def extract_item(container, fields, base_url: str) -> Dict[str, Any]:
+    """Извлекает значения полей из одного элемента-контейнера."""
+    item = {}
+    for field in fields:
+        elements = container.cssselect(field.selector)
+        if elements:
+            el = elements[0]
+            if field.type in ('text', 'number'):
+                value = el.text_content().strip()
+            elif field.type == 'link':
+                value = el.get('href')
+                if value and not value.startswith(('http://', 'https://')):
+                    value = urljoin(base_url, value)
+            elif field.type == 'image':
+                value = el.get('src')
+                if value and not value.startswith(('http://', 'https://')):
+                    value = urljoin(base_url, value)
+            else:
+                value = None
+        else:
+            value = None
+        item[field.name] = value
+    return item
+
 
 class SyncScraper:
-    def __init__(self, config: ConfigData, start_url: str, max_pages: Optional[int] = None):
+    def __init__(self, config: ConfigData, start_url: str, max_pages: Optional[int] = None,
+                 extraction_mode: Optional[str] = None, cancel_event: Optional[threading.Event] = None,
+                 deadline: Optional[float] = None, profiler=NULL_PROFILER):
         self.config = config
         self.start_url = start_url
         self.max_pages = max_pages
-        self.results = []
+        # "browser" – извлечение через page.evaluate, "lxml" – разбор page.content()
+        self.extraction_mode = extraction_mode or settings.scrape_extraction_mode
+        self._compiled_config = compile_config(config)
+        self.cancel_event = cancel_event
+        self.deadline = deadline  # time.monotonic(), после которого сбор прерывается
+        self.profiler = profiler
+        self.results = ColumnarResults(config)
         self.pages_processed = 0
+        self.items_seen = 0  # сколько элементов контейнера уже обработано (для scroll)
+        # False – браузер не принял селектор контейнера (например, :contains из cssselect),
+        # и элементы считаются по page.content()
+        self._browser_selector_ok = True
 
-    def run(self) -> List[Dict[str, Any]]:
+    def run(self) -> ColumnarResults:
         with sync_playwright() as p:
             browser = p.chromium.launch(headless=True)
             page = browser.new_page()
+            # Ни одно ожидание на странице не должно длиться дольше таймаута
+            page.set_default_timeout(settings.scrape_page_timeout_ms)
+            page.set_default_navigation_timeout(settings.scrape_page_timeout_ms)
             try:
-                page.goto(self.start_url, wait_until="networkidle", timeout=30000)
-                self._extract_page_data(page)
+                with self.profiler.span("fetch"):
+                    page.goto(self.start_url, wait_until="networkidle")
+                with self.profiler.span("extract_page_data"):
+                    self._extract_page_data(page)
                 self.pages_processed += 1
 
                 while self._has_next_page(page):
+                    self._check_limits()
                     if self.max_pages and self.pages_processed >= self.max_pages:
                         break
-                    self._perform_pagination(page)
-                    page.wait_for_load_state("networkidle")
-                    self._extract_page_data(page)
+                    with self.profiler.span("pagination"):
+                        if not self._perform_pagination(page):
+                            break
+                        page.wait_for_load_state("networkidle")
+                    with self.profiler.span("extract_page_data"):
+                        self._extract_page_data(page)
                     self.pages_processed += 1
             finally:
                 page.close()
                 browser.close()
         return self.results
 
+    def _check_limits(self):
+        """Прерывает сбор по отмене или по истечении времени задачи."""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ScrapeCancelled(f"Scrape cancelled after {self.pages_processed} pages")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise ScrapeTimeout(f"Scrape timed out after {self.pages_processed} pages")
+
+    def _is_scroll(self) -> bool:
+        return self.config.pagination is not None and self.config.pagination.type == 'scroll'
+
     def _extract_page_data(self, page):
-        content = page.content()
-        tree = html.fromstring(content)
-        containers = tree.cssselect(self.config.container_selector)
-        if not containers:
-            raise NoContainerFound(
-                f"Container selector '{self.config.container_selector}' not found on page {self.pages_processed + 1}"
-            )
-        page_items = []
-        for container in containers:
-            item = {}
-            for field in self.config.fields:
-                elements = container.cssselect(field.selector)
-                if elements:
-                    el = elements[0]
-                    if field.type in ('text', 'number'):
-                        value = el.text_content().strip()
-                    elif field.type == 'link':
-                        value = el.get('href')
-                        if value and not value.startswith(('http://', 'https://')):
-                            value = urljoin(page.url, value)
-                    elif field.type == 'image':
-                        value = el.get('src')
-                        if value and not value.startswith(('http://', 'https://')):
-                            value = urljoin(page.url, value)
-                    else:
-                        value = None
-                else:
-                    value = None
-                item[field.name] = value
-            page_items.append(item)
+        # Для scroll-пагинации обрабатываем только элементы, добавленные после прошлого прохода
+        start = self.items_seen if self._is_scroll() else 0
+        page_items = None
+        if self.extraction_mode == 'browser':
+            try:
+                total, page_items = extract_in_browser(page, self._compiled_config, start)
+            except PlaywrightError as e:
+                # Например, селектор, который понимает cssselect, но не браузер. Ошибка
+                # повторится на каждой странице, поэтому дальше извлекаем только через lxml
+                logger.warning(f"In-browser extraction failed, switching to lxml: {e}")
+                self.extraction_mode = 'lxml'
+            else:
+                if total == 0:
+                    self._raise_no_container()
+        if page_items is None:
+            page_items = self._extract_with_lxml(page, start)
+        self.items_seen = start + len(page_items)
 
         if not page_items:
             raise NoFieldsExtracted("No items extracted from containers")
         self.results.extend(page_items)
 
+    def _extract_with_lxml(self, page, start: int) -> List[Dict[str, Any]]:
+        if self._is_scroll() and self._browser_selector_ok:
+            # При бесконечной прокрутке берём только новые элементы, а не весь DOM
+            try:
+                fragments = page.evaluate(_NEW_ITEMS_HTML_JS, [self.config.container_selector, start])
+            except PlaywrightError as e:
+                logger.warning(f"Browser rejected container selector, reading items from page content: {e}")
+                self._browser_selector_ok = False
+            else:
+                containers = [html.fragment_fromstring(fragment) for fragment in fragments]
+                if not containers and start == 0:
+                    self._raise_no_container()
+                return [extract_item(container, self.config.fields, page.url) for container in containers]
+        containers = self._containers_from_content(page)
+        if not containers and start == 0:
+            self._raise_no_container()
+        return [extract_item(container, self.config.fields, page.url) for container in containers[start:]]
+
+    def _containers_from_content(self, page) -> list:
+        tree = html.fromstring(page.content())
+        return tree.cssselect(self.config.container_selector)
+
+    def _raise_no_container(self):
+        raise NoContainerFound(
+            f"Container selector '{self.config.container_selector}' not found on page {self.pages_processed + 1}"
+        )
+
     def _has_next_page(self, page) -> bool:
         pagination = self.config.pagination
         if not pagination:
@@ -83,22 +171,47 @@ class SyncScraper:
             return True
         return False
 
-    def _perform_pagination(self, page):
+    def _perform_pagination(self, page) -> bool:
+        """Переходит на следующую страницу. Возвращает False, если новых данных не появилось."""
         pagination = self.config.pagination
         if not pagination:
-            return
+            return False
         if pagination.type == 'next_button':
             page.click(pagination.selector)
         elif pagination.type == 'scroll':
-            last_height = page.evaluate("document.body.scrollHeight")
-            while True:
-                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                import time
-                time.sleep(2)
-                new_height = page.evaluate("document.body.scrollHeight")
-                if new_height == last_height:
-                    break
-                last_height = new_height
+            return self._scroll_for_more(page)
         elif pagination.type == 'url_pattern':
             next_url = pagination.url_template.replace("{page}", str(self.pages_processed + 2))
-            page.goto(next_url, wait_until="networkidle")
\ No newline at end of file
+            page.goto(next_url, wait_until="networkidle")
+        return True
+
+    def _scroll_for_more(self, page) -> bool:
+        """Прокручивает страницу и ждёт, пока в контейнере появятся новые элементы."""
+        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        waited_ms = 0
+        # Ждём короткими отрезками, чтобы вовремя заметить отмену задачи
+        while waited_ms < settings.scroll_wait_timeout_ms:
+            step_ms = min(1000, settings.scroll_wait_timeout_ms - waited_ms)
+            if not self._browser_selector_ok:
+                # Селектор браузеру не подходит – раз в отрезок считаем элементы по page.content()
+                page.wait_for_timeout(step_ms)
+                if len(self._containers_from_content(page)) > self.items_seen:
+                    return True
+                waited_ms += step_ms
+                self._check_limits()
+                continue
+            try:
+                page.wait_for_function(
+                    _WAIT_NEW_ITEMS_JS,
+                    arg=[self.config.container_selector, self.items_seen],
+                    timeout=step_ms,
+                )
+                return True
+            except PlaywrightTimeoutError:
+                waited_ms += step_ms
+                self._check_limits()
+            except PlaywrightError as e:
+                logger.warning(f"Browser rejected container selector, waiting on page content: {e}")
+                self._browser_selector_ok = False
+        # Новых элементов не дождались – лента закончилась
+        return False
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Реестр задач сбора, выполняющихся в этом процессе. Модуль лёгкий:
+# API импортирует его для отмены, не подгружая Playwright.
+# Задача может выполняться в другом процессе или поде, поэтому отмена передаётся
+# ещё и флагом scrape:{task_id}:cancel в Redis, который задача периодически проверяет.
+
+
+class ScrapeJob:
+    """Состояние запущенной задачи сбора, нужное для её отмены."""
+
+    def __init__(self):
+        # threading.Event – его проверяет SyncScraper в рабочем потоке
+        self.cancel_event = threading.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.started = False
+
+
+scrape_jobs: Dict[str, ScrapeJob] = {}
+
+
+def register_scrape_job(task_id: str) -> ScrapeJob:
+    return scrape_jobs.setdefault(task_id, ScrapeJob())
+
+
+def cancel_scrape_task(task_id: str) -> bool:
+    """Просит задачу остановиться. False – задача не выполняется в этом процессе."""
+    job = scrape_jobs.get(task_id)
+    if job is None:
+        return False
+    job.cancel_event.set()
+    if not job.started and job.task is not None:
+        # Задача ещё ждёт в очереди – просто снимаем её
+        job.task.cancel()
+    return True
+
+
+def cancel_key(task_id: str) -> str:
+    return f"scrape:{task_id}:cancel"
+
+
+async def request_cancel(redis, task_id: str):
+    """Отмена для задачи в любом процессе: флаг в Redis и сразу локальная отмена, если задача здесь."""
+    await redis.setex(cancel_key(task_id), 3600, "1")
+    cancel_scrape_task(task_id)
+
+
+async def watch_cancel(redis, task_id: str):
+    """Ждёт флага отмены в Redis и отменяет задачу этого процесса. Работает, пока его не отменят."""
+    while True:
+        try:
+            if await redis.exists(cancel_key(task_id)):
+                break
+        except Exception as e:
+            # Redis недоступен – задача продолжается, проверим на следующем шаге
+            logger.warning(f"Failed to check cancel flag of task {task_id}: {e}")
+        await asyncio.sleep(settings.scrape_cancel_poll_seconds)
+    cancel_scrape_task(task_id)
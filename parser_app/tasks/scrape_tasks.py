@@ -1,41 +1,89 @@
 import asyncio
-import json
 import logging
+import time
+from contextlib import nullcontext
+from typing import Optional
 from sqlalchemy import select
 
+from core.config import settings
+from core.profiling import save_profile, start_profiler
 from core.redis_client import get_redis
 from core.schemas import ConfigData
+from services.admission import Admission, run_in_thread
 from services.scraper.sync_scraper import SyncScraper
+from services.scraper.detail_crawler import DetailCrawler
+from services.scraper.exceptions import ScrapeCancelled, ScrapeTimeout
+from services.result_store import save_results
+from tasks.jobs import ScrapeJob, register_scrape_job, scrape_jobs, watch_cancel
 from models.config import ParserConfig
 from core.database import AsyncSessionLocal
 
 logger = logging.getLogger(__name__)
 
-async def run_scrape_task(task_id: str, config_id: int, start_url: str, max_pages: int = None):
+
+async def run_scrape_task(task_id: str, config_id: int, start_url: str, max_pages: int = None,
+                          admission: Optional[Admission] = None, profile: bool = False):
     redis = await get_redis()
+    job = register_scrape_job(task_id)
+    profiler = start_profiler(f"scrape {start_url}", profile)
+    # Отмена из другого процесса приходит флагом в Redis, в том числе пока задача в очереди
+    cancel_watcher = asyncio.create_task(watch_cancel(redis, task_id))
     try:
-        # Загружаем конфигурацию из БД
-        async with AsyncSessionLocal() as db:
-            result = await db.execute(select(ParserConfig).where(ParserConfig.id == config_id))
-            config_model = result.scalar_one_or_none()
-            if not config_model:
-                raise ValueError(f"Config {config_id} not found")
-            config_data = ConfigData(**config_model.config)
-
-        # Обновляем статус
-        await redis.setex(f"scrape:{task_id}:status", 3600, "PROCESSING")
-        await redis.setex(f"scrape:{task_id}:pages", 3600, "0")
-        await redis.setex(f"scrape:{task_id}:items", 3600, "0")
-
-        scraper = SyncScraper(config_data, start_url, max_pages)
-        results = await asyncio.to_thread(scraper.run)  # запуск в потоке
-
-        await redis.setex(f"scrape:{task_id}:data", 3600, json.dumps(results))
-        await redis.setex(f"scrape:{task_id}:pages", 3600, str(scraper.pages_processed))
-        await redis.setex(f"scrape:{task_id}:items", 3600, str(len(results)))
-        await redis.setex(f"scrape:{task_id}:status", 3600, "SUCCESS")
-        logger.info(f"Scrape task {task_id} completed, {len(results)} items")
+        async with admission or nullcontext():
+            job.started = True
+            await _scrape(redis, job, task_id, config_id, start_url, max_pages, profiler)
+    except (ScrapeCancelled, asyncio.CancelledError) as e:
+        logger.info(f"Scrape task {task_id} cancelled")
+        await redis.setex(f"scrape:{task_id}:status", 3600, "CANCELLED")
+        if isinstance(e, asyncio.CancelledError):
+            raise
     except Exception as e:
         logger.exception(f"Scrape task {task_id} failed")
         await redis.setex(f"scrape:{task_id}:status", 3600, "FAILURE")
-        await redis.setex(f"scrape:{task_id}:error", 3600, str(e))
\ No newline at end of file
+        await redis.setex(f"scrape:{task_id}:error", 3600, str(e))
+    finally:
+        cancel_watcher.cancel()
+        scrape_jobs.pop(task_id, None)
+        await save_profile(redis, task_id, profiler)
+
+
+async def _scrape(redis, job: ScrapeJob, task_id: str, config_id: int, start_url: str, max_pages: Optional[int],
+                  profiler):
+    if job.cancel_event.is_set():
+        raise ScrapeCancelled("Cancelled before start")
+    deadline = time.monotonic() + settings.scrape_job_timeout_seconds
+
+    # Загружаем конфигурацию из БД
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(ParserConfig).where(ParserConfig.id == config_id))
+        config_model = result.scalar_one_or_none()
+        if not config_model:
+            raise ValueError(f"Config {config_id} not found")
+        config_data = ConfigData(**config_model.config)
+
+    # Обновляем статус
+    await redis.setex(f"scrape:{task_id}:status", 3600, "PROCESSING")
+    await redis.setex(f"scrape:{task_id}:pages", 3600, "0")
+    await redis.setex(f"scrape:{task_id}:items", 3600, "0")
+
+    scraper = SyncScraper(config_data, start_url, max_pages, cancel_event=job.cancel_event, deadline=deadline,
+                          profiler=profiler)
+    results = await run_in_thread(profiler.wrap(scraper.run))  # запуск в потоке
+    results.compact()  # словари колонок нужны только для записи
+    await redis.setex(f"scrape:{task_id}:pages", 3600, str(scraper.pages_processed))
+    await redis.setex(f"scrape:{task_id}:items", 3600, str(len(results)))
+
+    if config_data.detail:
+        # Детальные страницы обходим в рамках той же задачи
+        crawler = DetailCrawler(config_data.detail, cancel_event=job.cancel_event)
+        try:
+            with profiler.span("detail_crawl"):
+                await asyncio.wait_for(crawler.crawl(results), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise ScrapeTimeout(f"Scrape exceeded {settings.scrape_job_timeout_seconds}s")
+        await redis.setex(f"scrape:{task_id}:details", 3600, str(crawler.pages_processed))
+
+    with profiler.span("redis_write"):
+        await save_results(redis, task_id, results)
+    await redis.setex(f"scrape:{task_id}:status", 3600, "SUCCESS")
+    logger.info(f"Scrape task {task_id} completed, {len(results)} items")
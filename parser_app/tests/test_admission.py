@@ -0,0 +1,277 @@
+import asyncio
+import threading
+import time
+import pytest
+from core.schemas import ScrapeStartRequest
+from services.admission import AdmissionController, QueueFull, run_in_thread
+
+
+@pytest.mark.asyncio
+async def test_admission_limits_and_queue():
+    controller = AdmissionController(max_running=1, max_per_user=2, max_queued=1)
+    first = controller.admit("user:1")
+    second = controller.admit("user:2")
+    # Лимит на пользователя и длина очереди
+    with pytest.raises(QueueFull):
+        controller.admit("user:3")
+    controller_user = AdmissionController(max_running=5, max_per_user=1, max_queued=5)
+    controller_user.admit("user:1")
+    with pytest.raises(QueueFull):
+        controller_user.admit("user:1")
+
+    order = []
+
+    async def job(admission, name):
+        async with admission:
+            order.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} end")
+
+    await asyncio.gather(job(first, "a"), job(second, "b"))
+    # Второй ждал в очереди, пока не освободился единственный слот
+    assert order == ["a start", "a end", "b start", "b end"]
+    assert controller.pending == 0
+    controller.admit("user:3")
+
+
+@pytest.mark.asyncio
+async def test_admission_released_when_cancelled_in_queue():
+    controller = AdmissionController(max_running=1, max_per_user=5, max_queued=5)
+    running = controller.admit("user:1")
+    queued = controller.admit("user:1")
+    await running.__aenter__()
+
+    async def wait_in_queue():
+        async with queued:
+            pass
+
+    task = asyncio.create_task(wait_in_queue())
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await running.__aexit__(None, None, None)
+    assert controller.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_slot_held_until_thread_finishes():
+    controller = AdmissionController(max_running=1, max_per_user=5, max_queued=5)
+    finished = threading.Event()
+
+    def slow():
+        time.sleep(0.3)
+        finished.set()
+
+    async def job():
+        async with controller.admit("user:1"):
+            await asyncio.wait_for(run_in_thread(slow), timeout=0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await job()
+    # Таймаут сработал, но слот освободился только после завершения потока
+    assert finished.is_set()
+    assert controller.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_start_scrape_releases_slot_when_start_fails(monkeypatch):
+    from api import scrape
+
+    class FakeDb:
+        async def get(self, model, config_id):
+            return object()
+
+    async def broken_redis():
+        raise ConnectionError("redis is down")
+
+    controller = AdmissionController(max_running=1, max_per_user=1, max_queued=0)
+    monkeypatch.setattr(scrape, "admission_controller", controller)
+    monkeypatch.setattr(scrape, "get_redis", broken_redis)
+    req = ScrapeStartRequest(config_id=1, start_url="https://shop.test/", user_id=7)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await scrape.start_scrape(req, request=None, db=FakeDb())
+    assert controller.pending == 0
+    assert not scrape.scrape_jobs
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def setex(self, key, ttl, value):
+        self.values[key] = value
+
+    async def exists(self, key):
+        return int(key in self.values)
+
+
+class FakeSession:
+    """AsyncSessionLocal(), отдающий сохранённую конфигурацию."""
+
+    def __init__(self, config):
+        self.config = config
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, stmt):
+        return self
+
+    def scalar_one_or_none(self):
+        return self
+
+
+CONFIG = {
+    "container_selector": "li",
+    "fields": [{"name": "title", "selector": "h3", "type": "text"}, {"name": "link", "selector": "a", "type": "link"}],
+}
+
+
+class BlockingScraper:
+    """SyncScraper, который листает страницы, пока задачу не отменят."""
+
+    def __init__(self, config, start_url, max_pages=None, cancel_event=None, deadline=None, profiler=None):
+        from services.scraper.result_buffer import ColumnarResults
+        self.cancel_event = cancel_event
+        self.results = ColumnarResults(config)
+        self.pages_processed = 0
+
+    def run(self):
+        from services.scraper.exceptions import ScrapeCancelled
+        while not self.cancel_event.wait(0.01):
+            self.pages_processed += 1
+            if self.pages_processed > 500:
+                raise AssertionError("cancel flag was not noticed")
+        raise ScrapeCancelled("cancelled")
+
+
+@pytest.fixture
+def scrape_env(monkeypatch):
+    from core.config import settings
+    from tasks import scrape_tasks
+    redis = FakeRedis()
+
+    async def get_redis():
+        return redis
+
+    monkeypatch.setattr(scrape_tasks, "get_redis", get_redis)
+    monkeypatch.setattr(settings, "scrape_cancel_poll_seconds", 0.01)
+    monkeypatch.setattr(scrape_tasks, "AsyncSessionLocal", lambda: FakeSession(CONFIG))
+    return redis
+
+
+async def wait_for_status(redis, task_id, status):
+    for _ in range(500):
+        if redis.values.get(f"scrape:{task_id}:status") == status:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"status {status} not reached: {redis.values.get(f'scrape:{task_id}:status')}")
+
+
+@pytest.mark.asyncio
+async def test_cancel_flag_from_other_process_stops_pagination(monkeypatch, scrape_env):
+    from tasks import scrape_tasks
+    from tasks.jobs import cancel_key, scrape_jobs
+    monkeypatch.setattr(scrape_tasks, "SyncScraper", BlockingScraper)
+
+    task = asyncio.create_task(scrape_tasks.run_scrape_task("t1", 1, "https://shop.test/"))
+    await wait_for_status(scrape_env, "t1", "PROCESSING")
+    # DELETE обработал другой процесс: здесь виден только флаг в Redis
+    scrape_env.values[cancel_key("t1")] = "1"
+    await asyncio.wait_for(task, timeout=5)
+    assert scrape_env.values["scrape:t1:status"] == "CANCELLED"
+    assert "t1" not in scrape_jobs
+
+
+@pytest.mark.asyncio
+async def test_cancel_flag_removes_task_from_queue(scrape_env):
+    from tasks import scrape_tasks
+    from tasks.jobs import cancel_key, register_scrape_job
+    controller = AdmissionController(max_running=1, max_per_user=5, max_queued=5)
+    running = controller.admit("user:1")
+    await running.__aenter__()
+
+    job = register_scrape_job("t2")
+    job.task = asyncio.create_task(scrape_tasks.run_scrape_task("t2", 1, "https://shop.test/",
+                                                                admission=controller.admit("user:1")))
+    await asyncio.sleep(0.05)
+    assert not job.started
+    scrape_env.values[cancel_key("t2")] = "1"
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(job.task, timeout=5)
+    assert scrape_env.values["scrape:t2:status"] == "CANCELLED"
+    await running.__aexit__(None, None, None)
+    assert controller.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_detail_crawl_stops_at_job_deadline(monkeypatch, scrape_env):
+    from core.config import settings
+    from tasks import scrape_tasks
+    from services.scraper.detail_crawler import DetailCrawler
+
+    class QuickScraper(BlockingScraper):
+        def run(self):
+            self.results.append({"title": "A", "link": "https://shop.test/a"})
+            return self.results
+
+    crawl_cancelled = asyncio.Event()
+
+    async def slow_crawl(self, results):
+        try:
+            await asyncio.sleep(10)
+        finally:
+            crawl_cancelled.set()
+
+    config = dict(CONFIG, detail={"link_field": "link", "fields": [{"name": "d", "selector": "p", "type": "text"}]})
+    monkeypatch.setattr(scrape_tasks, "AsyncSessionLocal", lambda: FakeSession(config))
+    monkeypatch.setattr(scrape_tasks, "SyncScraper", QuickScraper)
+    monkeypatch.setattr(DetailCrawler, "crawl", slow_crawl)
+    monkeypatch.setattr(settings, "scrape_job_timeout_seconds", 0.1)
+
+    await asyncio.wait_for(scrape_tasks.run_scrape_task("t3", 1, "https://shop.test/"), timeout=5)
+    assert crawl_cancelled.is_set()
+    assert scrape_env.values["scrape:t3:status"] == "FAILURE"
+    assert "exceeded" in scrape_env.values["scrape:t3:error"]
+
+
+@pytest.mark.asyncio
+async def test_delete_scrape_sets_cancel_flag(monkeypatch):
+    from fastapi import HTTPException
+    from api import scrape
+    from tasks.jobs import cancel_key, register_scrape_job, scrape_jobs
+    redis = FakeRedis()
+
+    async def get_redis():
+        return redis
+
+    monkeypatch.setattr(scrape, "get_redis", get_redis)
+    with pytest.raises(HTTPException) as error:
+        await scrape.cancel_scrape("unknown")
+    assert error.value.status_code == 404
+
+    # Задача выполняется в другом процессе: локальной записи нет, но флаг ставится
+    redis.values["scrape:remote:status"] = "PROCESSING"
+    assert (await scrape.cancel_scrape("remote"))["status"] == "CANCELLING"
+    assert cancel_key("remote") in redis.values
+
+    # Задача этого процесса отменяется сразу
+    redis.values["scrape:local:status"] = "PENDING"
+    job = register_scrape_job("local")
+    try:
+        await scrape.cancel_scrape("local")
+        assert job.cancel_event.is_set()
+    finally:
+        scrape_jobs.pop("local", None)
+
+    redis.values["scrape:done:status"] = "SUCCESS"
+    with pytest.raises(HTTPException):
+        await scrape.cancel_scrape("done")
@@ -1,5 +1,9 @@
 import pytest
-from services.analyzer.structure import find_repeating_blocks
+from services.analyzer.cache import AnalysisCache
+from core.schemas import Field
+from services.analyzer.structure import (block_templates, build_candidates, find_repeating_blocks,
+                                         find_repeating_groups, match_block_groups, structural_fingerprint)
+from services.analyzer.field_extractor import extract_fields_from_blocks, fill_examples
 
 def test_find_repeating_blocks():
     # Минимальный HTML с повторяющимися блоками
@@ -16,4 +20,166 @@ def test_find_repeating_blocks():
     # Проверим, что контейнер - body или div?
     # По нашему алгоритму сигнатура div.item должна совпасть, контейнером станет body
     # Но может быть несколько кандидатов. Проверим хотя бы не пусто.
-    assert candidates[0].count >= 3
\ No newline at end of file
+    assert candidates[0].count >= 3
+
+def test_extract_fields_from_blocks():
+    blocks = [
+        f'<div class="card"><h2 class="title">Item {i}</h2><span class="price">{i}99</span>'
+        f'<a class="more" href="/item/{i}">Details</a><img src="/img/{i}.png"><!-- c --><script>x()</script></div>'
+        for i in range(1, 6)
+    ]
+    fields = extract_fields_from_blocks(blocks)
+    by_selector = {f.selector: f for f in fields}
+    assert by_selector['h2.title'].type == 'text'
+    assert by_selector['h2.title'].example == 'Item 1'
+    assert by_selector['span.price'].type == 'number'
+    assert by_selector['a.more[href]'].type == 'link'
+    assert by_selector['a.more[href]'].attribute == 'href'
+    assert by_selector['img[src]'].type == 'image'
+    # Одинаковый во всех блоках текст отфильтрован
+    assert 'a.more' not in by_selector
+    # Текст блока собран без содержимого script
+    assert 'x()' not in by_selector['div.card'].example
+
+
+def test_extract_fields_keeps_text_after_comments():
+    # React SSR разделяет текстовые узлы пустыми комментариями
+    blocks = [
+        f'<div><h3><!-- -->Item<!-- --> {i}<b>!</b><!-- x -->?</h3><span class="price">{i}00<!-- --> ₽</span></div>'
+        for i in range(1, 5)
+    ]
+    by_selector = {f.selector: f for f in extract_fields_from_blocks(blocks)}
+    assert by_selector['h3'].example == 'Item 1!?'
+    assert by_selector['span.price'].example == '100 ₽'
+    assert by_selector['div'].example == 'Item 1!?100 ₽'
+
+
+def test_extract_fields_fill_rate_filter():
+    blocks = ['<div><b class="name">A%d</b></div>' % i for i in range(10)]
+    blocks[0] = '<div><b class="name">A0</b><i class="rare">only once</i></div>'
+    selectors = [f.selector for f in extract_fields_from_blocks(blocks)]
+    assert 'b.name' in selectors
+    assert 'i.rare' not in selectors
+
+
+def _catalog_page(titles, extra=""):
+    items = "".join(f'<li class="product"><h3>{t}</h3><span class="price">{len(t)}</span></li>' for t in titles)
+    return f'<html><body><nav class="menu"><a href="/">Home</a></nav><ul class="grid">{items}</ul>{extra}</body></html>'
+
+
+def test_structural_fingerprint():
+    page1 = _catalog_page(["Book A", "Book B", "Book C"])
+    page2 = _catalog_page(["Other 1", "Other 2"], extra="<script>var x = 1;</script>")
+    # Тот же шаблон: другой текст и число товаров не меняют отпечаток
+    assert structural_fingerprint(page1) == structural_fingerprint(page2)
+    # Новый блок на странице – другой шаблон
+    other_layout = _catalog_page(["Book A"], extra='<div class="pager"><a>2</a></div>')
+    assert structural_fingerprint(page1) != structural_fingerprint(other_layout)
+
+
+def _cards_page(titles):
+    # Каждая карточка в своём li: элементы группы div.card лежат в разных родителях
+    items = "".join(f'<li class="item"><div class="card"><a href="/p/{t}">{t}</a><b>{len(t)}</b></div></li>'
+                    for t in titles)
+    return f'<html><body><nav class="menu"><a href="/">Home</a></nav><ul class="grid">{items}</ul></body></html>'
+
+
+@pytest.mark.parametrize("make_page", [_catalog_page, _cards_page])
+def test_match_block_groups_equals_full_analysis(make_page):
+    first = make_page(["Book A", "Book B", "Book C"])
+    second = make_page([f"Other {i}" for i in range(1, 8)])
+    assert structural_fingerprint(first) == structural_fingerprint(second)
+    templates = block_templates(find_repeating_groups(first))
+    # Вторая страница того же шаблона: из кеша те же кандидаты, что и при полном анализе
+    from_cache = build_candidates(match_block_groups(second, templates))
+    assert from_cache == find_repeating_blocks(second)
+    assert all("Book" not in item for c in from_cache for item in c.example_items)
+    counts = {c.container_selector: c.count for c in from_cache}
+    assert counts["ul.grid"] == 7
+    if make_page is _cards_page:
+        # Группа блоков из разных родителей считается целиком, а не по первому контейнеру
+        assert counts["li.item:nth-child(1)"] == 7
+
+
+def test_match_block_groups_rejects_other_layout():
+    templates = block_templates(find_repeating_groups(_catalog_page(["Book A", "Book B", "Book C"])))
+    assert match_block_groups("<html><body><p>empty</p></body></html>", templates) is None
+    # Блоков шаблона меньше, чем нужно для группы, – нужен полный анализ
+    assert match_block_groups(_catalog_page(["Book A", "Book B"]), templates) is None
+
+
+def test_fill_examples_uses_current_page():
+    from lxml import html
+    first = [f'<div><h3>Book {i}</h3><span class="price">{i}00</span></div>' for i in range(1, 4)]
+    fields = extract_fields_from_blocks(first)
+    templates = [field.model_copy(update={"example": None}) for field in fields]
+    second = [html.fromstring('<div><h3>Other</h3></div>'),
+              html.fromstring('<div><h3>Other 2</h3><span class="price">900</span></div>')]
+    by_selector = {f.selector: f for f in fill_examples(templates, second)}
+    assert by_selector['h3'].example == 'Other'
+    # Поля нет в первом блоке – пример из следующего, как и при выводе полей
+    assert by_selector['span.price'].example == '900'
+    assert by_selector['span.price'].type == 'number'
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values, self.zsets = {}, {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def setex(self, key, ttl, value):
+        self.values[key] = value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    async def expire(self, key, ttl):
+        pass
+
+    async def hset(self, key, field, value):
+        self.values.setdefault(key, {})[field] = value
+
+    async def hget(self, key, field):
+        return self.values.get(key, {}).get(field)
+
+    async def zadd(self, key, mapping, xx=False):
+        zset = self.zsets.setdefault(key, {})
+        for member, score in mapping.items():
+            if not xx or member in zset:
+                zset[member] = score
+
+    async def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    async def zpopmin(self, key, count=1):
+        zset = self.zsets.get(key, {})
+        popped = sorted(zset.items(), key=lambda item: item[1])[:count]
+        for member, _ in popped:
+            del zset[member]
+        return popped
+
+
+@pytest.mark.asyncio
+async def test_analysis_cache_keeps_several_layouts_per_domain():
+    cache = AnalysisCache(FakeRedis(), "shop.test", max_layouts=2)
+    await cache.set_templates("listing", [("li", "sig1")])
+    await cache.set_templates("search", [("div", "sig2")])
+    # Оба шаблона домена остаются в кеше
+    assert await cache.get_templates("listing") == [("li", "sig1")]
+    assert await cache.get_templates("search") == [("div", "sig2")]
+    # Третий вытесняет давно не использованный
+    await cache.get_templates("listing")
+    await cache.set_templates("product", [("img", "sig3")])
+    assert await cache.get_templates("search") is None
+    assert await cache.get_templates("listing") is not None
+
+
+@pytest.mark.asyncio
+async def test_analysis_cache_stores_fields_without_examples():
+    cache = AnalysisCache(FakeRedis(), "shop.test")
+    fields = [Field(name="h3", selector="h3", type="text", example="Book A")]
+    await cache.set_fields("listing", "ul.grid", fields)
+    assert await cache.get_fields("listing", "ul.grid") == [Field(name="h3", selector="h3", type="text")]
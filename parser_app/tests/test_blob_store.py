@@ -0,0 +1,123 @@
+import asyncio
+import os
+import pytest
+import zlib
+from services import blob_store as blob_store_module
+from services.blob_store import BlobStore, DiskBlobStore, RedisBlobStore, iter_range, parse_range_header
+
+
+@pytest.mark.asyncio
+async def test_disk_blob_store_dedup(tmp_path):
+    store = DiskBlobStore(tmp_path, max_bytes=10 * 1024 * 1024)
+    html = b"<html>" + b"<div>item</div>" * 1000 + b"</html>"
+    key = await store.put(html)
+    assert await store.put(html) == key
+    assert len(list(tmp_path.glob("*/*.z"))) == 1
+    assert await store.get(key) == html
+    assert await store.get("0" * 64) is None
+
+
+@pytest.mark.asyncio
+async def test_disk_blob_store_eviction(tmp_path):
+    store = DiskBlobStore(tmp_path, max_bytes=2500)
+    blobs = [os.urandom(1000) for _ in range(3)]
+    keys = []
+    for i, data in enumerate(blobs):
+        keys.append(await store.put(data))
+        # Разносим mtime, чтобы порядок вытеснения был детерминированным
+        os.utime(store._path(keys[-1]), (i, i))
+    await store.put(os.urandom(1000))
+    assert await store.get(keys[0]) is None
+    assert await store.get(keys[2]) == blobs[2]
+
+
+def test_iter_range():
+    data = bytes(range(256)) * 1000
+    compressed = zlib.compress(data)
+    assert b"".join(iter_range(compressed, 0, len(data) - 1)) == data
+    assert b"".join(iter_range(compressed, 70000, 70100)) == data[70000:70101]
+
+
+def test_parse_range_header():
+    assert parse_range_header("bytes=0-99", 1000) == (0, 99)
+    assert parse_range_header("bytes=900-", 1000) == (900, 999)
+    assert parse_range_header("bytes=-100", 1000) == (900, 999)
+    assert parse_range_header("bytes=500-2000", 1000) == (500, 999)
+    assert parse_range_header("bytes=1000-", 1000) is None
+    assert parse_range_header("bytes=0-1,5-9", 1000) is None
+
+
+class FakeRedis:
+    """Минимум команд Redis, которые использует RedisBlobStore."""
+
+    def __init__(self):
+        self.values, self.hashes, self.zsets = {}, {}, {}
+
+    async def exists(self, key):
+        return int(key in self.values)
+
+    async def set(self, key, value, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def zadd(self, key, mapping, xx=False):
+        zset = self.zsets.setdefault(key, {})
+        for member, score in mapping.items():
+            if not xx or member in zset:
+                zset[member] = score
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def hset(self, key, field, value):
+        self.commands.append(lambda: self.redis.hashes.setdefault(key, {}).__setitem__(field, value))
+
+    def zadd(self, key, mapping):
+        self.commands.append(lambda: self.redis.zsets.setdefault(key, {}).update(mapping))
+
+    def incrby(self, key, amount):
+        def incr():
+            self.redis.values[key] = int(self.redis.values.get(key, 0)) + amount
+            return self.redis.values[key]
+        self.commands.append(incr)
+
+    async def execute(self):
+        return [command() for command in self.commands]
+
+
+@pytest.mark.asyncio
+async def test_redis_blob_store_counts_concurrent_puts_once(monkeypatch):
+    redis = FakeRedis()
+
+    async def get_binary_redis():
+        return redis
+
+    monkeypatch.setattr(blob_store_module, "get_binary_redis", get_binary_redis)
+    store = RedisBlobStore(max_bytes=10 * 1024 * 1024)
+    html = b"<html>" + b"<div>item</div>" * 1000 + b"</html>"
+    keys = await asyncio.gather(store.put(html), store.put(html))
+    assert keys[0] == keys[1]
+    assert redis.values[RedisBlobStore.TOTAL_KEY] == len(zlib.compress(html, 6))
+
+
+def test_incomplete_backend_fails_on_instantiation():
+    class NoReads(BlobStore):
+        async def put(self, data: bytes) -> str:
+            return ""
+
+    with pytest.raises(TypeError):
+        NoReads()
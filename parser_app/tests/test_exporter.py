@@ -0,0 +1,184 @@
+import csv
+import io
+import json
+import pytest
+from services.exporter.cache import ExportCache
+from services.exporter.exporter import Exporter, RowWriter
+
+COLUMNS = ["title", "price"]
+BATCHES = [
+    [{"title": "Книга 1", "price": "100"}, {"title": "Book, 2", "price": None}],
+    [],
+    [{"title": "Book 3", "price": "300"}],
+]
+ROWS = [row for batch in BATCHES for row in batch]
+
+
+def export(fmt: str) -> bytes:
+    out = io.BytesIO()
+    writer = Exporter.open_writer(fmt, out, COLUMNS)
+    for batch in BATCHES:
+        writer.write_rows(batch)
+    writer.close()
+    return out.getvalue()
+
+
+def test_export_json_and_ndjson():
+    assert json.loads(export("json")) == ROWS
+    assert [json.loads(line) for line in export("ndjson").decode().splitlines()] == ROWS
+
+
+def test_export_csv():
+    rows = list(csv.DictReader(io.StringIO(export("csv").decode())))
+    assert rows[1] == {"title": "Book, 2", "price": ""}
+    assert [row["title"] for row in rows] == ["Книга 1", "Book, 2", "Book 3"]
+
+
+def test_export_xlsx():
+    openpyxl = pytest.importorskip("openpyxl")
+    sheet = openpyxl.load_workbook(io.BytesIO(export("excel"))).active
+    values = list(sheet.values)
+    assert values[0] == tuple(COLUMNS)
+    assert values[3] == ("Book 3", "300")
+
+
+def test_export_parquet():
+    pq = pytest.importorskip("pyarrow.parquet")
+    parquet_file = pq.ParquetFile(io.BytesIO(export("parquet")))
+    assert parquet_file.num_row_groups == 2
+    assert parquet_file.read().to_pylist() == ROWS
+
+
+def test_export_columns_with_types():
+    pq = pytest.importorskip("pyarrow.parquet")
+    out = io.BytesIO()
+    writer = Exporter.open_writer("parquet", out, COLUMNS, {"title": "text", "price": "number"})
+    writer.write_columns({"title": ["A", None], "price": [1.5, None]})
+    writer.close()
+    table = pq.read_table(io.BytesIO(out.getvalue()))
+    assert str(table.schema.field("price").type) == "double"
+    assert table.to_pylist() == [{"title": "A", "price": 1.5}, {"title": None, "price": None}]
+
+    out = io.BytesIO()
+    writer = Exporter.open_writer("json", out, COLUMNS)
+    writer.write_columns({"title": ["A", "B"], "price": [1, None]})
+    writer.close()
+    assert json.loads(out.getvalue()) == [{"title": "A", "price": 1}, {"title": "B", "price": None}]
+
+
+def producer(data: bytes, calls=None):
+    async def produce(out):
+        if calls is not None:
+            calls.append(1)
+        for start in range(0, len(data), 4):
+            out.write(data[start:start + 4])
+            yield
+    return produce
+
+
+async def collect(stream) -> bytes:
+    return b"".join([chunk async for chunk in stream])
+
+
+@pytest.mark.asyncio
+async def test_export_cache(tmp_path):
+    cache = ExportCache(tmp_path, max_age_seconds=3600, max_bytes=10)
+    builds = []
+
+    assert cache.open_cached("task", "json", "v1") is None
+    chunks = [chunk async for chunk in cache.stream("task", "json", "v1", producer(b"12345678", builds))]
+    # Клиент получает экспорт частями по мере записи, на диске – тот же файл
+    assert chunks == [b"1234", b"5678"]
+    first = cache.open_cached("task", "json", "v1")
+    assert first.read_bytes() == b"12345678"
+    cache.release(first)
+    assert len(builds) == 1
+    # Новая версия результата вытесняет старый файл задачи
+    assert await collect(cache.stream("task", "json", "v2", producer(b"12345678"))) == b"12345678"
+    second = cache.path_for("task", "json", "v2")
+    assert not first.exists() and second.exists()
+    # Превышение лимита размера удаляет самые давние файлы
+    await collect(cache.stream("other", "csv", "v1", producer(b"12345678")))
+    assert cache.path_for("other", "csv", "v1").exists() and not second.exists()
+    assert cache._locks == {} and cache._in_use == {}
+
+
+@pytest.mark.asyncio
+async def test_export_cache_keeps_files_in_use(tmp_path):
+    cache = ExportCache(tmp_path, max_age_seconds=3600, max_bytes=10)
+
+    # Файл больше лимита не удаляется сразу после сборки
+    await collect(cache.stream("big", "json", "v1", producer(b"x" * 100)))
+    big = cache.open_cached("big", "json", "v1")
+    assert big is not None
+    # и пока отдаётся, его не вытесняет сборка другого файла
+    await collect(cache.stream("other", "json", "v1", producer(b"y" * 100)))
+    assert big.exists()
+    cache.release(big)
+    cache.evict()
+    assert not big.exists() and not cache.path_for("other", "json", "v1").exists()
+
+
+@pytest.mark.asyncio
+async def test_export_cache_drops_partial_file(tmp_path):
+    cache = ExportCache(tmp_path, max_age_seconds=3600, max_bytes=1000)
+
+    async def failing(out):
+        out.write(b"[1,")
+        yield
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await collect(cache.stream("broken", "json", "v1", failing))
+    # Клиент оборвал соединение после первой части
+    stream = cache.stream("gone", "json", "v1", producer(b"12345678"))
+    assert await stream.__anext__() == b"1234"
+    await stream.aclose()
+    assert list(tmp_path.iterdir()) == []
+    assert cache._locks == {} and cache._in_use == {}
+
+
+@pytest.mark.asyncio
+async def test_export_cache_builds_once_for_concurrent_requests(tmp_path):
+    import asyncio
+    cache = ExportCache(tmp_path, max_age_seconds=3600, max_bytes=1000)
+    builds = []
+    first, second = await asyncio.gather(
+        collect(cache.stream("task", "csv", "v1", producer(b"a,b\n1,2\n", builds))),
+        collect(cache.stream("task", "csv", "v1", producer(b"a,b\n1,2\n", builds))),
+    )
+    assert first == second == b"a,b\n1,2\n"
+    assert len(builds) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fmt", ["excel", "parquet"])
+async def test_export_cache_streams_binary_formats(tmp_path, fmt):
+    cache = ExportCache(tmp_path, max_age_seconds=3600, max_bytes=10 ** 6)
+
+    async def produce(out):
+        writer = Exporter.open_writer(fmt, out, COLUMNS)
+        for batch in BATCHES:
+            writer.write_rows(batch)
+            yield
+        writer.close()
+
+    streamed = await collect(cache.stream("task", fmt, "v1", produce))
+    # Писатели работают с потоком без seek, файл на диске совпадает с отданным
+    assert streamed == cache.path_for("task", fmt, "v1").read_bytes()
+    if fmt == "excel":
+        import openpyxl
+        sheet = openpyxl.load_workbook(io.BytesIO(streamed)).active
+        assert [cell.value for cell in sheet[1]] == COLUMNS
+        assert sheet.max_row == len(ROWS) + 1
+    else:
+        # Тот же файл, что и при записи в обычный BytesIO
+        assert streamed == export(fmt)
+
+
+def test_writer_without_write_rows_fails_on_instantiation():
+    class Incomplete(RowWriter):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete(io.BytesIO(), COLUMNS)
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+import pytest
+from core.profiling import NULL_PROFILER, Profiler, start_profiler
+
+
+def busy(profiler, seconds: float):
+    with profiler.span("extract_page_data"):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+    return "done"
+
+
+@pytest.mark.asyncio
+async def test_profiler_samples_threads_and_records_stages():
+    profiler = Profiler("test", interval_ms=1)
+    with profiler.span("scrape"):
+        result = await asyncio.to_thread(profiler.wrap(busy), profiler, 0.1)
+    assert result == "done"
+
+    data = profiler.to_speedscope()
+    frames = [frame["name"] for frame in data["shared"]["frames"]]
+    sampled = [p for p in data["profiles"] if p["type"] == "sampled"]
+    assert len(sampled) == 1 and sampled[0]["samples"]
+    # Сэмплы рабочего потока начинаются с открытого этапа
+    assert all(frames[stack[0]] == "[extract_page_data]" for stack in sampled[0]["samples"])
+    assert any(frames[stack[-1]] == "busy" for stack in sampled[0]["samples"])
+
+    evented = [p for p in data["profiles"] if p["type"] == "evented"]
+    assert "stages: async" in {p["name"] for p in evented}
+    for p in evented:
+        opened = [e["frame"] for e in p["events"] if e["type"] == "O"]
+        closed = [e["frame"] for e in p["events"] if e["type"] == "C"]
+        assert sorted(opened) == sorted(closed)
+    assert set(profiler.stage_totals()) == {"scrape", "extract_page_data"}
+
+
+def test_overlapping_stages_are_nested():
+    profiler = Profiler("test")
+    profiler.stop()
+    events = profiler._span_events([("a", 0.0, 2.0), ("b", 1.0, 3.0), ("c", 2.5, 4.0)])
+    stack = []
+    for event in events:
+        if event["type"] == "O":
+            stack.append(event["frame"])
+        else:
+            assert stack.pop() == event["frame"]
+    assert not stack
+
+
+def test_start_profiler_respects_flag_and_rate(monkeypatch):
+    from core.config import settings
+
+    monkeypatch.setattr(settings, "profile_sample_rate", 0.0)
+    assert start_profiler("task") is NULL_PROFILER
+    profiler = start_profiler("task", requested=True)
+    assert profiler.enabled
+    profiler.stop()
@@ -0,0 +1,246 @@
+import pytest
+from pydantic import ValidationError
+from core.schemas import ConfigData, DetailSchema, FieldSchema
+from services.scraper.detail_crawler import DetailCrawler
+from services.scraper.frontier import UrlFrontier
+from services.scraper.result_buffer import ColumnarResults
+
+
+def test_url_frontier_limits():
+    frontier = UrlFrontier(max_urls=2, max_depth=2)
+    assert frontier.add("https://example.com/a")
+    assert not frontier.add("https://example.com/a#reviews")
+    assert not frontier.add("https://example.com/b", depth=3)
+    assert frontier.add("https://example.com/b", depth=2)
+    assert not frontier.add("https://example.com/c")
+    assert len(frontier) == 2
+
+
+@pytest.mark.asyncio
+async def test_detail_crawler_merges_and_dedups(monkeypatch):
+    detail = DetailSchema(
+        link_field="link",
+        fields=[
+            FieldSchema(name="description", selector="p.desc", type="text"),
+            FieldSchema(name="seller", selector="a.seller", type="link"),
+        ],
+        detail=DetailSchema(link_field="seller", fields=[FieldSchema(name="rating", selector="b", type="number")]),
+    )
+    fetched = []
+
+    async def fake_fetch(self, client, detail, url):
+        fetched.append(url)
+        if "/seller/" in url:
+            return url, "<html><body><b>4.9</b></body></html>"
+        return url, f'<html><body><p class="desc">About {url[-1]}</p><a class="seller" href="/seller/1">s</a></body></html>'
+
+    monkeypatch.setattr(DetailCrawler, "_fetch", fake_fetch)
+    config = ConfigData(
+        container_selector="li",
+        fields=[FieldSchema(name="title", selector="h3", type="text"), FieldSchema(name="link", selector="a", type="link")],
+        detail=detail,
+    )
+    results = ColumnarResults(config)
+    results.extend([
+        {"title": "A", "link": "https://shop.test/item/a"},
+        {"title": "B", "link": "https://shop.test/item/b"},
+        {"title": "A again", "link": "https://shop.test/item/a#top"},
+        {"title": "No link", "link": None},
+    ])
+    crawler = DetailCrawler(detail)
+    await crawler.crawl(results)
+    items = list(results)
+
+    assert sorted(fetched) == ["https://shop.test/item/a", "https://shop.test/item/b", "https://shop.test/seller/1"]
+    assert items[0]["description"] == "About a"
+    assert items[2]["description"] == "About a"
+    assert items[1]["seller"] == "https://shop.test/seller/1"
+    assert items[1]["rating"] == 4.9
+    assert items[3]["description"] is None
+    assert crawler.pages_processed == 3
+
+
+@pytest.mark.asyncio
+async def test_detail_crawler_limits_each_level(monkeypatch):
+    fetched = []
+
+    async def fake_fetch(self, client, detail, url):
+        fetched.append(url)
+        return url, f'<html><body><a class="seller" href="/seller/{url[-1]}">s</a><b>5</b></body></html>'
+
+    monkeypatch.setattr(DetailCrawler, "_fetch", fake_fetch)
+    detail = DetailSchema(
+        link_field="link", max_urls=3,
+        fields=[FieldSchema(name="seller", selector="a.seller", type="link")],
+        detail=DetailSchema(link_field="seller", max_urls=1, fields=[FieldSchema(name="rating", selector="b", type="number")]),
+    )
+    config = ConfigData(container_selector="li", fields=[FieldSchema(name="link", selector="a", type="link")], detail=detail)
+    results = ColumnarResults(config)
+    results.extend([{"link": f"https://shop.test/item/{i}"} for i in range(1, 5)])
+    await DetailCrawler(detail).crawl(results)
+
+    assert len([url for url in fetched if "/item/" in url]) == 3
+    assert len([url for url in fetched if "/seller/" in url]) == 1
+    assert [row["rating"] for row in results].count(5) == 1
+
+
+def test_config_rejects_detail_fields_shadowing_upper_levels():
+    with pytest.raises(ValidationError):
+        ConfigData(
+            container_selector="li",
+            fields=[FieldSchema(name="title", selector="h3", type="text"), FieldSchema(name="link", selector="a", type="link")],
+            detail=DetailSchema(link_field="link", fields=[FieldSchema(name="title", selector="h1", type="text")]),
+        )
+    # Повторы внутри одного уровня встречаются в сохранённых конфигурациях и остаются допустимыми
+    config = ConfigData(
+        container_selector="li",
+        fields=[FieldSchema(name="price", selector=".old", type="number"),
+                FieldSchema(name="price", selector=".new", type="number"),
+                FieldSchema(name="link", selector="a", type="link")],
+        detail=DetailSchema(link_field="link", fields=[FieldSchema(name="spec", selector="td", type="text"),
+                                                       FieldSchema(name="spec", selector="dd", type="text")]),
+    )
+    assert len(config.fields) == 3
+
+
+class FakeBrowserPage:
+    def __init__(self, log):
+        self.log = log
+        self.url = None
+
+    def goto(self, url, wait_until=None, timeout=None):
+        if "broken" in url:
+            raise RuntimeError("net::ERR_FAILED")
+        self.log.append(("goto", url))
+        self.url = url
+
+    def wait_for_load_state(self, state=None, timeout=None):
+        self.log.append(("load", self.url))
+
+    def content(self):
+        return f"<html><body>{self.url}</body></html>"
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.launches, self.closed, self.pages, self.log = 0, 0, [], []
+        self.chromium = self
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def launch(self, headless=True):
+        self.launches += 1
+        return self
+
+    def new_context(self, viewport=None):
+        return self
+
+    def new_page(self):
+        self.pages.append(FakeBrowserPage(self.log))
+        return self.pages[-1]
+
+    def close(self):
+        self.closed += 1
+
+
+@pytest.mark.asyncio
+async def test_browser_page_pool_uses_one_browser(monkeypatch):
+    import asyncio
+    import playwright.sync_api
+    from services.fetcher import BrowserPagePool
+
+    fake = FakePlaywright()
+    monkeypatch.setattr(playwright.sync_api, "sync_playwright", fake)
+    pool = BrowserPagePool(max_pages=2)
+    urls = [f"https://shop.test/item/{i}" for i in range(5)]
+    results = await asyncio.gather(*(pool.fetch(url) for url in urls), pool.fetch("https://shop.test/broken"),
+                                   return_exceptions=True)
+    await pool.close()
+
+    assert [result[0] for result in results[:5]] == urls
+    assert isinstance(results[5], RuntimeError)
+    # Один браузер на все страницы, вкладок не больше max_pages, браузер закрыт
+    assert fake.launches == 1 and fake.closed == 1
+    assert len(fake.pages) == 2
+    with pytest.raises(RuntimeError):
+        await pool.fetch(urls[0])
+
+
+def test_columnar_results():
+    config = ConfigData(
+        container_selector="li",
+        fields=[FieldSchema(name="title", selector="h3", type="text"),
+                FieldSchema(name="price", selector=".price", type="number")],
+    )
+    results = ColumnarResults(config)
+    results.extend([
+        {"title": "Book", "price": "1299"},
+        {"title": "Book", "price": "12.5"},
+        {"title": None, "price": None, "extra": "x"},
+    ])
+    assert len(results) == 3
+    assert results.column_types() == {"title": "text", "price": "number", "extra": "text"}
+    assert list(results) == [
+        {"title": "Book", "price": 1299, "extra": None},
+        {"title": "Book", "price": 12.5, "extra": None},
+        {"title": None, "price": None, "extra": "x"},
+    ]
+    # Повторяющиеся строки хранятся один раз
+    assert results._columns["title"].values == ["Book"]
+    assert list(results.iter_batches(2)) == [
+        {"title": ["Book", "Book"], "price": [1299, 12.5], "extra": [None, None]},
+        {"title": [None], "price": [None], "extra": ["x"]},
+    ]
+    # Нечисловое значение переводит колонку в текстовую без потери данных
+    results.update(2, {"price": "по запросу"})
+    assert results.column_types()["price"] == "text"
+    assert [row["price"] for row in results] == ["1299", "12.5", "по запросу"]
+
+
+@pytest.mark.parametrize("value", [
+    "4607001234567890123",  # артикул длиннее точности float64
+    "1234567890123456",
+    "123456789012345678901",  # 21 цифра – больше 64-битного целого
+    "007",
+    "1 299",
+    "12,5",
+    "1e3",
+])
+def test_columnar_results_keep_numbers_that_do_not_round_trip(value):
+    config = ConfigData(container_selector="li", fields=[FieldSchema(name="sku", selector=".sku", type="number")])
+    results = ColumnarResults(config)
+    results.extend([{"sku": "42"}, {"sku": value}])
+    assert results.column_types() == {"sku": "text"}
+    assert [row["sku"] for row in results] == ["42", value]
+
+
+def test_columnar_results_drop_dictionary_for_unique_values():
+    config = ConfigData(container_selector="li", fields=[FieldSchema(name="url", selector="a", type="link"),
+                                                         FieldSchema(name="brand", selector=".brand", type="text")])
+    results = ColumnarResults(config)
+    items = [{"url": f"https://shop.test/item/{i}", "brand": f"Бренд {i % 3}"} for i in range(3000)]
+    results.extend(items)
+    assert type(results._columns["url"]).__name__ == "_PlainTextColumn"
+    assert results._columns["brand"].values == ["Бренд 0", "Бренд 1", "Бренд 2"]
+    results.update(5, {"url": "https://shop.test/другой", "brand": None})
+    results.compact()
+    assert results._columns["brand"].index is None
+    items[5] = {"url": "https://shop.test/другой", "brand": None}
+    assert list(results) == items
+    # После compact запись снова возможна
+    results.update(6, {"brand": "Бренд 9"})
+    assert results.get(6, "brand") == "Бренд 9"
+
+
+def test_columnar_results_use_less_memory_than_rows():
+    from benchmarks.bench_result_buffer import build_columnar, make_items, measure
+    rows = measure(lambda: make_items(0, 20_000))
+    columnar = measure(lambda: build_columnar(20_000))
+    assert columnar * 2 < rows
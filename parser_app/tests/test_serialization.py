@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from core.schemas import BlobRef, ConfigData, Field, FieldSchema, PageData
+from core.serialization import RawJSON, dump_model, dump_models, dumps, encode_object, load_model, load_models, loads
+
+
+def test_page_data_round_trip_skips_content():
+    page = PageData(url="https://example.com", final_url="https://example.com/", title="Заголовок",
+                    html="<html></html>", html_ref=BlobRef(key="k", size=13, content_type="text/html"))
+    encoded = dump_model(page)
+    assert b"<html>" not in encoded
+    restored = load_model(PageData, encoded.decode("utf-8"))
+    assert restored.html is None
+    assert restored.html_ref == page.html_ref
+    assert restored.title == "Заголовок"
+
+
+def test_models_and_plain_values():
+    fields = [Field(name="price", selector=".price", type="number", example="100")]
+    assert load_models(Field, dump_models(fields)) == fields
+    assert dump_models([]) == b"[]"
+    data = {"title": ["Книга", None], "price": [1.5, 2]}
+    assert loads(dumps(data)) == data
+    assert "Книга".encode("utf-8") in dumps(data)
+
+
+def test_encode_object_embeds_raw_json():
+    body = encode_object(session_id="s1", fields=RawJSON('[{"name":"a"}]'), total=1)
+    assert json.loads(body) == {"session_id": "s1", "fields": [{"name": "a"}], "total": 1}
+
+
+def test_dumps_integers_beyond_64_bits():
+    assert json.loads(dumps({"barcode": [10 ** 21, 1]})) == {"barcode": [10 ** 21, 1]}
+
+
+@pytest.mark.asyncio
+async def test_save_results_with_long_numeric_values():
+    from services.result_store import iter_results, save_results
+    from services.scraper.result_buffer import ColumnarResults
+
+    class FakeRedis:
+        def __init__(self):
+            self.values, self.lists = {}, {}
+
+        async def delete(self, key):
+            self.lists.pop(key, None)
+
+        async def rpush(self, key, value):
+            self.lists.setdefault(key, []).append(value)
+
+        async def expire(self, key, ttl):
+            pass
+
+        async def setex(self, key, ttl, value):
+            self.values[key] = value
+
+        async def lindex(self, key, index):
+            items = self.lists.get(key, [])
+            return items[index] if index < len(items) else None
+
+    config = ConfigData(container_selector="li", fields=[FieldSchema(name="barcode", selector=".b", type="number")])
+    results = ColumnarResults(config)
+    # Первая пачка – числовая колонка со значением за пределами 64 бит
+    results.extend([{"barcode": 1e21}, {"barcode": "5"}])
+    redis = FakeRedis()
+    await save_results(redis, "task", results)
+    rows = [row async for batch in iter_results(redis, "task") for row in batch]
+    assert rows == [{"barcode": 1e21}, {"barcode": 5}]
+
+    results.append({"barcode": "123456789012345678901"})
+    await save_results(redis, "task", results)
+    rows = [row async for batch in iter_results(redis, "task") for row in batch]
+    assert rows[-1] == {"barcode": "123456789012345678901"}
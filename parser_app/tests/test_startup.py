@@ -0,0 +1,29 @@
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+# Бюджет на холодный импорт приложения (микросекунды, по python -X importtime)
+IMPORT_BUDGET_US = 2_000_000
+# Эти модули должны подгружаться только при первом использовании
+HEAVY_MODULES = ("pandas", "playwright", "lxml", "pyarrow", "openpyxl", "httpx", "asyncpg")
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=APP_DIR, capture_output=True, text=True, timeout=60)
+
+
+def test_heavy_modules_not_imported_on_startup():
+    code = f"import sys, main; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = run_python("-c", code)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_import_time_budget():
+    result = run_python("-X", "importtime", "-c", "import main")
+    assert result.returncode == 0, result.stderr
+    match = re.search(r"^import time:\s+\d+ \|\s+(\d+) \| main$", result.stderr, re.MULTILINE)
+    assert match, "importtime output for main not found"
+    assert int(match.group(1)) < IMPORT_BUDGET_US
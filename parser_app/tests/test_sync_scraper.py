@@ -0,0 +1,259 @@
+import threading
+import time
+
+import pytest
+from playwright.sync_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+
+from core.config import settings
+from core.schemas import ConfigData, FieldSchema, PaginationSchema
+from services.scraper.browser_extractor import _EXTRACT_JS, compile_config
+from services.scraper import sync_scraper
+from services.scraper.exceptions import NoContainerFound, ScrapeCancelled, ScrapeTimeout
+from services.scraper.sync_scraper import SyncScraper, _NEW_ITEMS_HTML_JS, _WAIT_NEW_ITEMS_JS
+
+BASE_URL = "https://shop.test/catalog/"
+
+
+class FakePage:
+    """Страница с фиксированным списком элементов; page.evaluate эмулирует JS-сниппеты скрапера."""
+
+    def __init__(self, items, browser_rows=None, fail_browser=False, reject_container=False):
+        self.items = items
+        self.browser_rows = browser_rows
+        self.fail_browser = fail_browser or reject_container
+        self.reject_container = reject_container  # querySelectorAll не принимает селектор контейнера
+        self.url = BASE_URL
+        self.content_calls = 0
+        self.evaluate_calls = 0
+
+    def content(self):
+        self.content_calls += 1
+        return f"<html><body><ul>{''.join(self.items)}</ul></body></html>"
+
+    def evaluate(self, script, arg=None):
+        self.evaluate_calls += 1
+        if script == _EXTRACT_JS:
+            if self.fail_browser:
+                raise PlaywrightError("unsupported selector")
+            return {"total": len(self.items), "rows": self.browser_rows[arg["start"]:len(self.items)]}
+        if script == _NEW_ITEMS_HTML_JS:
+            if self.reject_container:
+                raise PlaywrightError("SyntaxError: ':contains' is not a valid selector")
+            return self.items[arg[1]:]
+        return None
+
+
+def item(number: int) -> str:
+    return f'<li class="item"><h3> Item {number} </h3><a href="/item/{number}">more</a></li>'
+
+
+def make_config(pagination=None) -> ConfigData:
+    return ConfigData(
+        container_selector="li.item",
+        fields=[FieldSchema(name="title", selector="h3", type="text"),
+                FieldSchema(name="link", selector="a", type="link")],
+        pagination=pagination,
+    )
+
+
+def expected(number: int) -> dict:
+    return {"title": f"Item {number}", "link": f"https://shop.test/item/{number}"}
+
+
+@pytest.mark.parametrize("mode", ["lxml", "browser"])
+def test_scroll_extracts_only_appended_items(mode):
+    scraper = SyncScraper(make_config(PaginationSchema(type="scroll")), BASE_URL, extraction_mode=mode)
+    page = FakePage([item(1), item(2)], browser_rows=[expected(n) for n in range(1, 5)])
+    scraper._extract_page_data(page)
+    page.items += [item(3), item(4)]
+    scraper._extract_page_data(page)
+
+    assert scraper.items_seen == 4
+    assert list(scraper.results) == [expected(n) for n in range(1, 5)]
+    # При scroll-пагинации весь DOM через page.content() не читается
+    assert page.content_calls == 0
+
+
+def test_scroll_wait_stops_when_no_new_items(monkeypatch):
+    monkeypatch.setattr(settings, "scroll_wait_timeout_ms", 2500)
+    scraper = SyncScraper(make_config(PaginationSchema(type="scroll")), BASE_URL, extraction_mode="lxml")
+    waits = []
+
+    class ScrollPage(FakePage):
+        def wait_for_function(self, script, arg, timeout):
+            assert script == _WAIT_NEW_ITEMS_JS
+            waits.append(timeout)
+            if self.items_after_wait:
+                return True
+            raise PlaywrightTimeoutError("timeout")
+
+    page = ScrollPage([item(1)])
+    page.items_after_wait = False
+    assert scraper._scroll_for_more(page) is False
+    # Ждём отрезками не длиннее секунды, чтобы замечать отмену
+    assert waits == [1000, 1000, 500]
+
+    page.items_after_wait = True
+    assert scraper._scroll_for_more(page) is True
+
+
+def test_compile_config():
+    config = make_config()
+    assert compile_config(config) == {
+        "container": "li.item",
+        "fields": [{"name": "title", "selector": "h3", "type": "text"},
+                   {"name": "link", "selector": "a", "type": "link"}],
+    }
+
+
+def test_browser_extraction_falls_back_to_lxml_with_same_semantics():
+    config = ConfigData(
+        container_selector="a.card",
+        fields=[
+            # Поле совпадает с самим контейнером – как Element.matches() в JS-экстракторе
+            FieldSchema(name="link", selector="a.card", type="link"),
+            FieldSchema(name="title", selector="span", type="text"),
+            FieldSchema(name="image", selector="img", type="image"),
+            FieldSchema(name="missing", selector=".none", type="text"),
+        ],
+    )
+    page = FakePage(['<a class="card" href="../item/1"><span>\n  Item 1 \t</span><img src="/i/1.png"></a>',
+                     '<a class="card" href="https://other.test/2"><span>Item 2</span></a>'],
+                    fail_browser=True)
+    scraper = SyncScraper(config, BASE_URL, extraction_mode="browser")
+    scraper._extract_page_data(page)
+
+    assert list(scraper.results) == [
+        {"link": "https://shop.test/item/1", "title": "Item 1", "image": "https://shop.test/i/1.png", "missing": None},
+        {"link": "https://other.test/2", "title": "Item 2", "image": None, "missing": None},
+    ]
+    assert page.content_calls == 1
+
+
+def test_browser_extraction_switches_to_lxml_after_first_failure():
+    scraper = SyncScraper(make_config(), BASE_URL, extraction_mode="browser")
+    page = FakePage([item(1)], fail_browser=True)
+    scraper._extract_page_data(page)
+    scraper._extract_page_data(page)
+    # Второй раз page.evaluate не вызывается
+    assert scraper.extraction_mode == "lxml"
+    assert page.evaluate_calls == 1
+    assert list(scraper.results) == [expected(1), expected(1)]
+
+
+@pytest.mark.parametrize("mode", ["lxml", "browser"])
+def test_scroll_reads_page_content_when_browser_rejects_container(monkeypatch, mode):
+    monkeypatch.setattr(settings, "scroll_wait_timeout_ms", 3000)
+    scraper = SyncScraper(make_config(PaginationSchema(type="scroll")), BASE_URL, extraction_mode=mode)
+
+    class ScrollPage(FakePage):
+        def wait_for_timeout(self, timeout):
+            # Новые элементы подгружаются на второй секунде ожидания
+            self.waits = getattr(self, "waits", 0) + 1
+            if self.waits == 2:
+                self.items += [item(3)]
+
+    page = ScrollPage([item(1), item(2)], reject_container=True)
+    scraper._extract_page_data(page)
+    assert scraper._scroll_for_more(page) is True
+    scraper._extract_page_data(page)
+    assert list(scraper.results) == [expected(n) for n in range(1, 4)]
+    assert scraper.items_seen == 3
+    # Лента закончилась: новых элементов нет
+    assert scraper._scroll_for_more(page) is False
+
+
+def test_browser_extraction_uses_evaluate_rows():
+    rows = [{"title": "Item 1", "link": "https://shop.test/item/1"}]
+    scraper = SyncScraper(make_config(), BASE_URL, extraction_mode="browser")
+    page = FakePage([item(1)], browser_rows=rows)
+    scraper._extract_page_data(page)
+    assert list(scraper.results) == rows
+    assert page.content_calls == 0
+    # Совпадает с тем, что дал бы lxml-путь
+    lxml_scraper = SyncScraper(make_config(), BASE_URL, extraction_mode="lxml")
+    lxml_scraper._extract_page_data(page)
+    assert list(lxml_scraper.results) == rows
+
+    with pytest.raises(NoContainerFound):
+        scraper._extract_page_data(FakePage([], browser_rows=[]))
+
+
+class PaginatedPage(FakePage):
+    """Страница для SyncScraper.run: каждый goto открывает следующую страницу каталога."""
+
+    def __init__(self, on_goto=None):
+        super().__init__([item(1)])
+        self.on_goto = on_goto
+        self.gotos = 0
+        self.closed = False
+
+    def set_default_timeout(self, timeout):
+        pass
+
+    set_default_navigation_timeout = set_default_timeout
+
+    def goto(self, url, wait_until=None):
+        self.gotos += 1
+        self.items = [item(self.gotos)]
+        if self.on_goto:
+            self.on_goto(self.gotos)
+
+    def wait_for_load_state(self, state=None):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    """sync_playwright(), chromium и браузер в одном объекте."""
+
+    def __init__(self, page):
+        self.page = page
+        self.chromium = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def launch(self, headless=True):
+        return self
+
+    def new_page(self):
+        return self.page
+
+    def close(self):
+        pass
+
+
+def run_with_page(monkeypatch, scraper, page):
+    monkeypatch.setattr(sync_scraper, "sync_playwright", lambda: FakeBrowser(page))
+    return scraper.run()
+
+
+def test_run_stops_on_cancel_during_pagination(monkeypatch):
+    cancel_event = threading.Event()
+    config = make_config(PaginationSchema(type="url_pattern", url_template=BASE_URL + "?page={page}"))
+    scraper = SyncScraper(config, BASE_URL, extraction_mode="lxml", cancel_event=cancel_event)
+    # Отмена приходит, пока загружается вторая страница
+    page = PaginatedPage(on_goto=lambda number: number == 2 and cancel_event.set())
+    with pytest.raises(ScrapeCancelled):
+        run_with_page(monkeypatch, scraper, page)
+    # Вторая страница дособрана, третья уже не запрашивалась, браузер закрыт
+    assert scraper.pages_processed == 2
+    assert page.gotos == 2
+    assert page.closed
+    assert list(scraper.results) == [expected(1), expected(2)]
+
+
+def test_run_stops_at_job_deadline(monkeypatch):
+    config = make_config(PaginationSchema(type="url_pattern", url_template=BASE_URL + "?page={page}"))
+    scraper = SyncScraper(config, BASE_URL, extraction_mode="lxml", deadline=time.monotonic() + 3600)
+    page = PaginatedPage(on_goto=lambda number: number == 3 and setattr(scraper, "deadline", 0))
+    with pytest.raises(ScrapeTimeout):
+        run_with_page(monkeypatch, scraper, page)
+    assert scraper.pages_processed == 3
+    assert page.closed